@@ -78,6 +78,15 @@ Multi-File Processing and Sphinx Support
 antiweb creates .rst files which can be further processed by documentation systems like Sphinx.
 Additionally you can process multiple files at once with the -r option added.
 The optional directory parameter then can be empty to use the current directory, or you provide the directory antiweb should use.
+With the -j option (e.g. ``-j 8``) the files are processed by several worker processes.
+A build cache directory can be given with the --cache-dir option: files that did not change since the last run
+(including the files they include) are not processed again (see :ref:`Build Cache <label-build-cache>`).
+The --profile option prints the time of each processing phase for each file
+(see :ref:`Profiling <label-profiling>`).
+The --report option writes a json report of the run, e.g. for a CI system or a dashboard, and the
+-q option suppresses the message of each file (see :ref:`Run Report <label-report>`).
+With the --shard option (e.g. ``--shard 2/4``) the files are split between several machines
+(see :ref:`Sharding <label-sharding>`).
 
 
 .. _label-daemon-mode:
@@ -90,6 +99,11 @@ If -r is used together with the *daemon* option -d antiweb does not exit after c
 Instead antiweb starts a daemon which monitors file changes of the previously processed source directory
 and automatically creates the documentation files with the updated content.
 Antiweb uses the python library *Watchdog* to monitor the source directory.
+The file events are collected until no new event arrived for 200 milliseconds, the window can be changed
+with the --debounce-ms option. Each changed file is processed only once per collected batch. A batch is processed
+at the latest after ten debounce windows, even if further events arrive.
+The documentation files are created by a pool of worker threads (--daemon-workers option), so a slow file does not
+delay the delivery of further file events.
 
 
 Read the documentation of the corresponding event file handler (:ref:`FileChangeHandler <label-filechangehandler>`).
@@ -102,6 +116,15 @@ Supported Languages
 
 #@include(supported_languages doc, antiweb_lib\readers\config.py)
 
+#@include(file index doc, antiweb_lib\readers\config.py)
+
+#@include(get_language_for_file, antiweb_lib\readers\config.py)
+
+The comments of a source file are found by the ``pygments`` or the ``native`` engine
+(see :ref:`Language <label-language>`). The engine of each language is selected with the --engine option:
+
+#@include(set_engine, antiweb_lib\readers\config.py)
+
 .. _label-add_language:
 
 ************************
@@ -227,16 +250,19 @@ Directives
 #@code
 from optparse import OptionParser
 import logging
+import time
 import sys
 import os.path
 import os
 
-from antiweb_lib.write import write
-
-from watchdog.observers import Observer
-from antiweb_lib.filechangehandler import FileChangeHandler
+from antiweb_lib.write import write_result, report_result, has_main_block
+from antiweb_lib.profiling import format_profile, save_profile
+from antiweb_lib.report import create_report, save_report
+from antiweb_lib.sharding import parse_shard, select_shard, create_manifest, save_manifest, check_manifests
+from antiweb_lib.parallel import write_files
+from antiweb_lib.dependencies import DependencyGraph
 
-from antiweb_lib.readers.config import is_file_supported
+from antiweb_lib.readers.config import is_file_supported, set_engines
 
 #@rstart(management)
 
@@ -283,6 +309,56 @@ def parsing():
                                                 "automatically updates the resulting documentation files - "
                                                 "can only be used together with -r option")
 
+    parser.add_option("--debounce-ms", dest="debounce_ms", default=200,
+                      type="int", help="daemon mode: milliseconds without a file event before the collected "
+                                       "changes are processed (default: 200)")
+
+    parser.add_option("--daemon-workers", dest="daemon_workers", default=1,
+                      type="int", help="daemon mode: number of threads creating the documentation files (default: 1)")
+
+    parser.add_option("-c", "--cache-dir", dest="cache_dir", default="",
+                      type="string", help="directory of a build cache: unchanged files are not processed again")
+
+    parser.add_option("-i", "--incremental", dest="incremental",
+                      action="store_true", help="only regenerate the files of the -r option whose source or "
+                                                "included files changed since the last run")
+
+    parser.add_option("-j", "--jobs", dest="jobs", default=1,
+                      type="int", help="number of worker processes used by the -r option (default: 1)")
+
+    parser.add_option("--max-include-depth", dest="max_include_depth", default=50,
+                      type="int", help="the maximum nesting depth of @include directives (default: 50)")
+
+    parser.add_option("--max-lines", dest="max_lines", default=1000000,
+                      type="int", help="the maximum number of lines inserted by @include directives "
+                                       "into one document (default: 1000000)")
+
+    parser.add_option("--engine", dest="engine", action="append", default=[],
+                      type="string", help="the engine finding the comments: 'pygments' lexes the whole source, "
+                                          "'native' only scans for comments and is much faster (default: pygments). "
+                                          "LANGUAGE=ENGINE selects the engine of one language (e.g. Python=native)")
+    parser.add_option("--profile", dest="profile",
+                      action="store_true", help="prints the time of each processing phase for each file")
+    parser.add_option("--profile-json", dest="profile_json", default="",
+                      type="string", help="writes the timings of the --profile option to a json file")
+    parser.add_option("--cprofile", dest="cprofile", default="",
+                      type="string", help="runs antiweb with cProfile and writes the statistics to a file")
+
+    parser.add_option("--report", dest="report", default="",
+                      type="string", help="writes a json report of the processed files (daemon mode: "
+                                          "written again on exit)")
+
+    parser.add_option("--shard", dest="shard", default="",
+                      type="string", help="-r option: only processes the part INDEX/COUNT (e.g. 2/4) of the files "
+                                          "and writes a manifest of the part into the output directory")
+
+    parser.add_option("--check-shards", dest="check_shards",
+                      action="store_true", help="checks the manifests of all shards in the given directory "
+                                                "after their outputs were merged")
+
+    parser.add_option("-q", "--quiet", dest="quiet",
+                      action="store_true", help="does not print a message for each processed file")
+
     options, args = parser.parse_args()
 
     #There is no argument given, so we assume the user wants to use the current directory.
@@ -306,6 +382,42 @@ def main():
         parser.print_help()
         sys.exit(0)
 
+    if options.jobs < 1:
+        sys_exit("the number of jobs must be at least 1: %i" % options.jobs)
+
+    if options.debounce_ms < 0:
+        sys_exit("the debounce window must not be negative: %i" % options.debounce_ms)
+
+    if options.daemon_workers < 1:
+        sys_exit("the number of daemon workers must be at least 1: %i" % options.daemon_workers)
+
+    if options.max_include_depth < 1:
+        sys_exit("the maximum include depth must be at least 1: %i" % options.max_include_depth)
+
+    if options.max_lines < 1:
+        sys_exit("the maximum number of lines must be at least 1: %i" % options.max_lines)
+
+    try:
+        set_engines(options.engine)
+    except ValueError as e:
+        sys_exit(str(e))
+
+    if options.profile_json or options.cprofile:
+        options.profile = True
+
+    shard = None
+    if options.shard:
+        try:
+            shard = parse_shard(options.shard)
+        except ValueError as e:
+            sys_exit(str(e))
+
+        if not options.recursive:
+            sys_exit("the --shard option can only be used together with the -r option")
+
+        if options.daemon:
+            sys_exit("the --shard option can not be used in daemon mode")
+
 #@edoc
 
 #The program checks if a -r flag was given and if so, save the current directory and change it to the given one.
@@ -323,6 +435,43 @@ def main():
         output_path = os.path.join(previous_dir, options.output)
         options.output = os.path.abspath(output_path)
 
+    if options.check_shards:
+        #the directory contains the merged outputs of all shards (see :ref:`Sharding <label-sharding>`)
+        if not os.path.isdir(absolute_path):
+            sys_exit("directory not found: %s" % absolute_path)
+
+        problems, checked_files = check_manifests(absolute_path)
+        for problem in problems:
+            logger.error("  %s", problem)
+
+        if problems:
+            sys_exit("the shards are not complete")
+
+        print("All %i files of the shards were processed" % checked_files)
+        return True
+
+    if options.cache_dir:
+        #the working directory changes during processing
+        options.cache_dir = os.path.abspath(options.cache_dir)
+
+    #the profile files are relative to the current working directory, too
+    if options.profile_json:
+        options.profile_json = os.path.abspath(options.profile_json)
+
+    if options.report:
+        options.report = os.path.abspath(options.report)
+
+    if options.cprofile:
+        options.cprofile = os.path.abspath(options.cprofile)
+        #imported here: cProfile is only needed with the --cprofile option
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    #the duration of the run for the --report option
+    start_time = time.perf_counter()
+    skipped_files = 0
+
     if options.recursive:
         directory = absolute_path
 
@@ -337,36 +486,105 @@ def main():
 #@edoc
 
 #The program walks through the given directory and all subdirectories. The absolute file names
-#are retrieved. Only files with the allowed extensions are processed.
+#are retrieved. Only files with the allowed extensions are processed. Files without a main text block
+#are skipped before they are lexed (see :py:meth:`has_main_block`). With the --shard option only the files
+#of the given shard are kept and a manifest of the shard is written (see :ref:`Sharding <label-sharding>`).
 
 #@code
 
-        handled_files = []
+        supported_files = []
 
         for root, dirs, files in os.walk(directory, topdown=False):
             for filename in files:
                 fname = os.path.join(root, filename)
 
-                if not (os.path.isfile(fname) and is_file_supported(fname)):
-                    continue
+                if os.path.isfile(fname) and is_file_supported(fname):
+                    supported_files.append(fname)
+
+        total_files = len(supported_files)
+        if shard:
+            #with the --shard option only a part of the files is processed (see :ref:`Sharding <label-sharding>`)
+            supported_files = select_shard(directory, supported_files, options, *shard)
+
+        handled_files = []
+        without_main_block = set()
+
+        for fname in supported_files:
+            if not has_main_block(fname):
+                without_main_block.add(fname)
+                continue
+
+            # rst files should be handled last as they might be a documentation file of a
+            # file that is not yet processed -> in this case the rst file will be ignored
+            if fname.endswith(".rst"):
+                handled_files.append(fname)
+            else:
+                handled_files.insert(0, fname)
 
-                # rst files should be handled last as they might be a documentation file of a
-                # file that is not yet processed -> in this case the rst file will be ignored
-                if fname.endswith(".rst"):
-                    handled_files.append(fname)
-                else:
-                    handled_files.insert(0, fname)
+        skipped_files = len(without_main_block)
+
+        if skipped_files and options.warnings:
+            logger.info("Skipped %i files without a @start() directive", skipped_files)
+
+#@edoc
+
+#While the files are generated a :ref:`dependency graph <label-dependencies>` is built. With the --incremental
+#option the graph of the previous run is loaded from the output directory and only the outdated files are generated.
+#The outputs of the up to date files count as created files.
+
+#@code
+
+        output_dir = options.output or directory
+        graph_file = os.path.join(output_dir, DependencyGraph.file_name)
+        if shard:
+            #each shard has its own graph, the graphs must not overwrite each other when the outputs are merged
+            graph_file = os.path.join(output_dir, "%s_shard_%i_of_%i.json"
+                                      % (os.path.splitext(DependencyGraph.file_name)[0], shard[0], shard[1]))
+
+        settings = { "version" : __version__,
+                     "tokens" : sorted(set(options.token or [])),
+                     "output" : options.output,
+                     "engine" : options.engine }
+
+        existing_files = set(handled_files)
+
+        if options.incremental:
+            graph = DependencyGraph.load(graph_file, settings)
+            outdated = graph.outdated(handled_files)
+            up_to_date = [f for f in handled_files if f not in outdated]
+            handled_files = [f for f in handled_files if f in outdated]
+        else:
+            graph = DependencyGraph(settings)
+            up_to_date = []
 
         #used to store all created files: needed for daemon mode if source and output directory are the same
         #or directory is a subdirectory of the source directory
-        created_files = set()
+        created_files = graph.get_outputs(up_to_date)
+
+        #with the --jobs option the files are processed in parallel (see :ref:`Parallel Processing <label-parallel>`)
+        results = write_files(directory, handled_files, options, created_files)
 
-        for file in handled_files:
-            if not file in created_files:
-                out_file = write(directory, file, options)
+        for result in results:
+            graph.update(result)
 
-                if out_file:
-                    created_files.add(out_file)
+        for source in set(graph.outputs) - existing_files:
+            #the source file was deleted
+            graph.remove(source)
+
+        if options.incremental:
+            graph.save(graph_file)
+
+        if shard:
+            if not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+
+            outputs = { f : graph.outputs[f] for f in up_to_date if graph.outputs.get(f) }
+            save_manifest(output_dir, create_manifest(shard, settings, total_files, directory, output_dir,
+                                                      supported_files, results, without_main_block, outputs))
+
+        if options.report:
+            duration = time.perf_counter() - start_time
+            save_report(options.report, create_report(results, duration, skipped_files))
 
 #@edoc
 
@@ -376,6 +594,9 @@ def main():
 #@code
 
         if options.daemon:
+            #watchdog is only needed in daemon mode
+            from watchdog.observers import Observer
+            from antiweb_lib.filechangehandler import FileChangeHandler
 
             #starting our filechange observer
             observer = Observer()
@@ -383,7 +604,8 @@ def main():
             try:
                 #observed directory => input directory
                 #recursive option is true in order to monitor all subdirectories
-                observer.schedule(FileChangeHandler(directory, options, created_files), path=directory, recursive=True)
+                event_handler = FileChangeHandler(directory, options, created_files, graph)
+                observer.schedule(event_handler, path=directory, recursive=True)
 
                 print("\n------- starting daemon mode (exit with enter or ctrl+c) -------\n")
 
@@ -395,6 +617,19 @@ def main():
                 #KeyboardInterrupt => ctrl+c
                 observer.stop()
 
+            observer.join()
+            event_handler.stop()
+
+            if options.incremental:
+                graph.save(graph_file)
+
+            #the report and the profile contain the files of the daemon, too
+            results = results + event_handler.results
+
+            if options.report:
+                duration = time.perf_counter() - start_time
+                save_report(options.report, create_report(results, duration, skipped_files))
+
             print("\n------- exiting daemon mode -------")
 
 
@@ -421,7 +656,28 @@ def main():
         if directory:
             os.chdir(directory)
 
-        write(os.getcwd(), absolute_file_path, options)
+        result = write_result(os.getcwd(), absolute_file_path, options)
+        report_result(result, not options.quiet)
+        results = [result]
+
+        if options.report:
+            save_report(options.report, create_report(results, time.perf_counter() - start_time))
+
+#@edoc
+
+#With the --profile option the timings of the processed files are reported (see :ref:`Profiling <label-profiling>`).
+
+#@code
+
+    if options.cprofile:
+        profiler.disable()
+        profiler.dump_stats(options.cprofile)
+
+    if options.profile:
+        print("\n" + format_profile(results))
+
+        if options.profile_json:
+            save_profile(options.profile_json, results)
 
     os.chdir(previous_dir)
     return True
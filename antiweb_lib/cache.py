@@ -0,0 +1,157 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import os
+import json
+import hashlib
+import logging
+from antiweb_lib.fileutil import write_json
+
+logger = logging.getLogger('antiweb')
+
+#@start()
+"""
+.. _label-build-cache:
+
+###########
+Build Cache
+###########
+
+#@include(BuildCache doc)
+
+#@include(hash_text doc)
+"""
+
+#@cstart(hash_text)
+def hash_text(text):
+#@start(hash_text doc)
+    """
+.. py:method:: hash_text(text)
+
+   Computes the content hash used by the build cache.
+
+   :param string text: The content of a file.
+   :return: A hex digest of the content.
+    """
+#@include(hash_text)
+#@(hash_text doc)
+    return hashlib.sha1(text.encode("utf-8", "surrogateescape")).hexdigest()
+
+def _hash_file(fname):
+    try:
+        with open(fname, "r") as f:
+            return hash_text(f.read())
+    except (IOError, UnicodeDecodeError):
+        return None
+#@(hash_text)
+
+#@cstart(BuildCache)
+class BuildCache(object):
+    #@start(BuildCache doc)
+    """
+    .. py:class:: BuildCache(directory)
+
+       An on-disk cache for generated documentation (``--cache-dir`` option).
+
+       For each source file the cache stores the rendered rst together with everything the
+       output depends on:
+
+         * the hash of the source file,
+         * the set of active ``--token`` values,
+         * the engines of the ``--engine`` option,
+         * the hashes of all files read by ``@include`` directives with a file name,
+         * the antiweb version.
+
+       If all of them are unchanged, the stored output is used and the source file
+       does not have to be processed again. The warnings of the generation are stored
+       too and written again, when the cached output is used.
+
+       :param string directory: The cache directory. It is created if it does not exist.
+    """
+    #@indent 3
+    #@include(BuildCache)
+    #@include(BuildCache.lookup doc)
+    #@include(BuildCache.store doc)
+    #@(BuildCache doc)
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, fname):
+        key = hashlib.sha1(os.path.abspath(fname).encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    #@cstart(BuildCache.lookup)
+    def lookup(self, fname, text, tokens, engine=()):
+        """
+        .. py:method:: lookup(fname, text, tokens[, engine])
+
+           Returns the cached output of a source file.
+
+           :param string fname: The path of the source file.
+           :param string text: The current content of the source file.
+           :param tokens: The active tokens.
+           :param engine: The values of the ``--engine`` option.
+           :return: The cache entry, a dictionary with the keys ``output``,
+                    ``dependencies`` and ``warnings``, or None if there is no valid entry.
+        """
+        try:
+            with open(self._entry_path(fname), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        if not isinstance(entry, dict) or "output" not in entry:
+            return None
+
+        if (entry.get("version") != __version__
+            or entry.get("source") != hash_text(text)
+            or entry.get("tokens") != sorted(set(tokens or []))
+            or entry.get("engine") != list(engine or [])):
+            return None
+
+        for dependency, dependency_hash in entry.get("dependencies", {}).items():
+            if _hash_file(dependency) != dependency_hash:
+                return None
+
+        return entry
+
+    #@cstart(BuildCache.store)
+    def store(self, fname, text, tokens, dependencies, output, engine=(), warnings=None):
+        """
+        .. py:method:: store(fname, text, tokens, dependencies, output[, engine, warnings])
+
+           Stores the output of a source file.
+
+           :param string fname: The path of the source file.
+           :param string text: The content the output was generated from.
+           :param tokens: The active tokens.
+           :param dependencies: The absolute paths of the included files
+                                (see :py:meth:`Document.get_dependencies`).
+           :param string output: The generated documentation.
+           :param engine: The values of the ``--engine`` option.
+           :param warnings: The warning texts of the generation or None, if the
+                            warnings were not checked.
+        """
+        entry = { "version" : __version__,
+                  "file" : os.path.abspath(fname),
+                  "source" : hash_text(text),
+                  "tokens" : sorted(set(tokens or [])),
+                  "engine" : list(engine or []),
+                  "dependencies" : { d : _hash_file(d) for d in sorted(dependencies) },
+                  "output" : output,
+                  "warnings" : None if warnings is None else list(warnings) }
+
+        #a concurrent reader never sees a partial entry
+        try:
+            write_json(self._entry_path(fname), entry)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write build cache entry for %s: %s", fname, e)
+    #@(BuildCache.store)
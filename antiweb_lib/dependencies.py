@@ -0,0 +1,214 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import os
+import json
+import logging
+from antiweb_lib.fileutil import stat_file, write_json
+
+logger = logging.getLogger('antiweb')
+
+#@start()
+"""
+.. _label-dependencies:
+
+################
+Dependency Graph
+################
+
+#@include(DependencyGraph doc)
+"""
+
+#@cstart(DependencyGraph)
+class DependencyGraph(object):
+    #@start(DependencyGraph doc)
+    """
+    .. py:class:: DependencyGraph(settings)
+
+       Records which files a documentation file depends on. A source file depends on all files
+       that are read by its ``@include`` directives with a file name (directly or by an
+       included file). If one of these files changes, the documentation of the source file
+       is outdated.
+
+       The graph is built while the files are generated. In daemon mode it is used to
+       regenerate the files including a changed file. With the ``--incremental``
+       option it is saved next to the output files, the next ``-r`` run only regenerates
+       the files that are affected by a change.
+
+       :param dict settings: The settings the outputs were generated with (tokens, output option,
+                             antiweb version). A saved graph is only used if the settings are equal.
+    """
+    #@indent 3
+    #@include(DependencyGraph)
+    #@include(DependencyGraph.update doc)
+    #@include(DependencyGraph.remove doc)
+    #@include(DependencyGraph.affected doc)
+    #@include(DependencyGraph.changed_files doc)
+    #@include(DependencyGraph.outdated doc)
+    #@include(DependencyGraph.get_outputs doc)
+    #@include(DependencyGraph.load doc)
+    #@include(DependencyGraph.save doc)
+    #@(DependencyGraph doc)
+
+    file_name = ".antiweb_deps.json"
+
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+        #source file -> output file or None
+        self.outputs = {}
+        #source file -> set of files it depends on
+        self.dependencies = {}
+        #file -> [modification time, size] at the time it was processed
+        self.stats = {}
+
+    #@cstart(DependencyGraph.update)
+    def update(self, result):
+        """
+        .. py:method:: update(result)
+
+           Records the dependencies of a processed file.
+
+           :param result: The :py:class:`WriteResult` of the processed file.
+        """
+        source = result.input_file
+        self.outputs[source] = result.out_file
+        self.dependencies[source] = set(result.dependencies)
+
+        for fname in [source] + list(result.dependencies):
+            self.stats[fname] = stat_file(fname)
+
+    #@cstart(DependencyGraph.remove)
+    def remove(self, source):
+        """
+        .. py:method:: remove(source)
+
+           Removes a source file that no longer exists from the graph.
+        """
+        self.outputs.pop(source, None)
+        self.dependencies.pop(source, None)
+        self.stats.pop(source, None)
+
+    #@cstart(DependencyGraph.affected)
+    def affected(self, changed_files):
+        """
+        .. py:method:: affected(changed_files)
+
+           Computes the source files whose documentation has to be regenerated.
+
+           :param changed_files: The absolute paths of the changed files.
+           :return: A set containing the changed source files and all source files
+                    depending on a changed file.
+        """
+        changed_files = set(changed_files)
+        affected = set(s for s in changed_files if s in self.outputs)
+
+        for source, dependencies in self.dependencies.items():
+            #the recorded dependencies are already transitive
+            if not dependencies.isdisjoint(changed_files):
+                affected.add(source)
+
+        return affected
+
+    #@cstart(DependencyGraph.changed_files)
+    def changed_files(self, files):
+        """
+        .. py:method:: changed_files(files)
+
+           Finds the changed files since the graph was built.
+
+           :param files: The absolute paths of the current source files.
+           :return: A set of all given files, that are unknown or changed, and all recorded
+                    dependencies that changed or were deleted.
+        """
+        changed = set(f for f in files if self.stats.get(f) != stat_file(f))
+
+        for dependencies in self.dependencies.values():
+            for fname in dependencies:
+                if fname not in changed and self.stats.get(fname) != stat_file(fname):
+                    changed.add(fname)
+
+        return changed
+
+    #@cstart(DependencyGraph.outdated)
+    def outdated(self, files):
+        """
+        .. py:method:: outdated(files)
+
+           Computes the source files that have to be regenerated.
+
+           :param files: The absolute paths of the current source files.
+           :return: A set of all source files that are affected by a change, did not
+                    create an output or whose output was deleted.
+        """
+        outdated = self.affected(self.changed_files(files))
+
+        for fname in files:
+            out_file = self.outputs.get(fname)
+            if not (out_file and os.path.isfile(out_file)):
+                outdated.add(fname)
+
+        return outdated
+
+    #@cstart(DependencyGraph.get_outputs)
+    def get_outputs(self, sources):
+        """
+        .. py:method:: get_outputs(sources)
+
+           :param sources: Absolute paths of source files.
+           :return: The set of the recorded output files of the sources.
+        """
+        return set(self.outputs[s] for s in sources if self.outputs.get(s))
+
+    #@cstart(DependencyGraph.load)
+    @classmethod
+    def load(cls, fname, settings):
+        """
+        .. py:method:: load(fname, settings)
+
+           Loads a saved graph. If the file does not exist, cannot be read or
+           was saved with other settings an empty graph is returned.
+
+           :param string fname: The path of the saved graph.
+           :param dict settings: The current settings.
+           :return: A :py:class:`DependencyGraph`.
+        """
+        graph = cls(settings)
+
+        try:
+            with open(fname, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return graph
+
+        if not isinstance(data, dict) or data.get("settings") != settings:
+            return graph
+
+        graph.outputs = data["outputs"]
+        graph.dependencies = { s : set(d) for s, d in data["dependencies"].items() }
+        graph.stats = data["stats"]
+        return graph
+
+    #@cstart(DependencyGraph.save)
+    def save(self, fname):
+        """
+        .. py:method:: save(fname)
+
+           Saves the graph as a json file.
+
+           :param string fname: The path of the saved graph.
+        """
+        data = { "settings" : self.settings,
+                 "outputs" : self.outputs,
+                 "dependencies" : { s : sorted(d) for s, d in self.dependencies.items() },
+                 "stats" : self.stats }
+
+        try:
+            write_json(fname, data, indent=1, sort_keys=True)
+        except (IOError, OSError) as e:
+            logger.warning("Could not save the dependency graph %s: %s", fname, e)
+
+    #@(DependencyGraph.save)
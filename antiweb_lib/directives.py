@@ -31,6 +31,8 @@ Directives
 @include(Enifed doc)
 @include(Subst doc)
 @include(Indent doc)
+@include(DirectiveScanner doc)
+@include(find_block_ends doc)
 """
 
 #@cstart(Directive)
@@ -68,6 +70,9 @@ class Directive(object):
     #@include(Directive.match doc)
     #@include(Directive.__repr__ doc)
     #@
+
+    __slots__ = ("line",)
+
     #Attributes
     #@cstart(Directive.expression)
     expression = ""
@@ -84,13 +89,14 @@ class Directive(object):
        An integer process priority. Directives with a lower priority
        will be processed earlier.
     """
-    #@cstart(Directive.line)
-    line = None
+    #@start(Directive.line doc)
     """
     .. py:attribute:: line
 
        A integer defining the original line number of the directive.
+
     """
+    #@(Directive.line doc)
     #@
 
     #Methods
@@ -189,6 +195,8 @@ class NameDirective(Directive):
     #@indent 3
     #@include(NameDirective)
     #@
+    __slots__ = ("name",)
+
     def __init__(self, line, mo):
         super(NameDirective, self).__init__(line, mo)
         if isinstance(mo, str):
@@ -245,74 +253,99 @@ class Start(NameDirective):
     #@indent 3
     #@include(Start)
     #@include(Start.has_named_end doc)
+    #@include(Start.end_line doc)
     #@rinclude(Start.inherited attributes)
     #@include(Start.collect_block doc)
     #@include(Start.process doc)
     #@include(Start._find_matching_end doc)
     #@(Start doc)
+    __slots__ = ("has_named_end", "end_line")
+
     #Attributes
-    #@cstart(Start.has_named_end)
-    has_named_end = False
+    #@start(Start.has_named_end doc)
     """
     .. py:attribute:: has_named_end
 
        A boolean value, signalizing if the directive is
        ended by a named end directive.
+
     """
+    #@(Start.has_named_end doc)
+    #@start(Start.end_line doc)
+    """
+    .. py:attribute:: end_line
+
+       The index of the line ending the text block within the
+       lines of the source file. It is set by :py:func:`find_block_ends`.
+
+    """
+    #@(Start.end_line doc)
     #@cstart(Start.inherited attributes)
     expression = re.compile(r"@start\((.*)\)")
     priority = 5
     #@
 
     #Methods
+    def __init__(self, line, mo):
+        super(Start, self).__init__(line, mo)
+        self.has_named_end = False
+        self.end_line = None
+
     #@cstart(Start._find_matching_end)
-    def _find_matching_end(self, block):
+    def _find_matching_end(self, block, index=0):
         """
-        .. py:method:: _find_matching_end(block)
+        .. py:method:: _find_matching_end(block[, index])
 
            Finds the matching end for the text block.
 
-           :param list block: A list of lines beginning with start
-           :return: The line index of the found end.
+           :param list block: A list of lines
+           :param integer index: The index of the line containing the start directive.
+           :return: The line index of the found end, relative to ``index``.
         """
         if self.has_named_end:
             # ignore all other ending conditions and directly
             # find the matching end directive
-            for j, l in enumerate(block[1:]):
-                j += 1
-                d = l.directive
+            for j in range(index+1, len(block)):
+                d = block[j].directive
                 if isinstance(d, End) and d.name == self.name:
-                    return j
-
-        start_indent = block[0].indent
-        for j, l in enumerate(block[1:]):
-            j += 1
+                    return j - index
 
+        start_indent = block[index].indent
+        for j in range(index+1, len(block)):
+            l = block[j]
             lindent = l.indent
             d = l.directive
 
-            if isinstance(d, End):
-                if d.name is None and lindent == start_indent:
-                    #case 4: An unnamed @ directive with the same indentation
-                    #        as the @start directive.
-                    return j
+            if self._is_ended_by(l, lindent, start_indent):
+                return j - index
 
-                if d.start_line <= self.line:
-                    #case 5: A named @ directive closing this block
-                    #        or an outer block.
-                    return j
+        #case 1: The end of the file
+        return len(block) - index
 
-            if isinstance(d, Start) and lindent == start_indent:
-                #case 3: Another @start directive with same indentation.
-                return j
+    def _is_ended_by(self, l, lindent, start_indent):
+        d = l.directive
 
-            if lindent < start_indent and l:
-                #case 2: A line with a smaller indentation as the @start directive.
-                #        (an empty line doesn't count)
-                return j
+        if isinstance(d, End):
+            if d.name is None and lindent == start_indent:
+                #case 4: An unnamed @ directive with the same indentation
+                #        as the @start directive.
+                return True
 
-        #case 1: The end of the file
-        return len(block)
+            if d.start_line <= self.line:
+                #case 5: A named @ directive closing this block
+                #        or an outer block.
+                return True
+
+        if isinstance(d, Start) and lindent == start_indent:
+            #case 3: Another @start directive with same indentation.
+            return True
+
+        if lindent < start_indent and l:
+            #case 2: A line with a smaller indentation as the @start directive.
+            #        (an empty line doesn't count)
+            return True
+
+        return False
 
     #@cstart(Start.collect_block)
     def collect_block(self, document, index):
@@ -322,7 +355,11 @@ class Start(NameDirective):
            See :py:meth:`Directive.collect_block`.
            The returned lines are unindented to column 0.
         """
-        end = self._find_matching_end(document.lines[index:])
+        if self.end_line is not None:
+            end = self.end_line - index
+        else:
+            end = self._find_matching_end(document.lines, index)
+
         block = document.lines[index+1:index+end]
 
         reduce_block = list(filter(bool, block))
@@ -333,7 +370,7 @@ class Start(NameDirective):
         #unindent the block, empty lines may not count (filter(bool, block))
         indent_getter = operator.attrgetter("indent")
         min_indent = min(list(map(indent_getter, reduce_block)))
-        block = [ l.clone().change_indent(-min_indent) for l in block ]
+        block = [ l.modified(-min_indent) for l in block ]
         return self.name, block
 
 
@@ -346,7 +383,8 @@ class Start(NameDirective):
            Removes all lines of the text block from
            the containing block.
         """
-        end = self._find_matching_end(block[index:])
+        #the block may be changed by other directives: the end is searched again
+        end = self._find_matching_end(block, index)
         del block[index:index+end]
     #@
 
@@ -376,8 +414,10 @@ class RStart(Start):
     #@(RStart doc)
     expression = re.compile(r"@rstart\((.*)\)")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
-        end = self._find_matching_end(block[index:])
+        end = self._find_matching_end(block, index)
         line = block[index]
         block[index:index+end] = [ line.like("<<%s>>" % self.name) ]
 
@@ -410,6 +450,8 @@ class CStart(RStart):
     #@(CStart doc)
     expression = re.compile(r"@cstart\((.*)\)")
 
+    __slots__ = ()
+
     def collect_block(self, document, index):
         name_block = super(CStart, self).collect_block(document, index)
 
@@ -447,6 +489,8 @@ class End(NameDirective):
     #@(End doc)
     expression = re.compile(r"@(\((.*)\))?\s*$", re.M)
 
+    __slots__ = ("start_line",)
+
     def __init__(self, line, mo):
         super(NameDirective, self).__init__(line, mo)
         self.start_line = self.line
@@ -456,17 +500,7 @@ class End(NameDirective):
         else:
             self.name = mo.group(2)
 
-
-    def match(self, lines):
-        if self.name is None: return
-
-        #find the matching start and inform it for the named end
-        for l in reversed(lines[:self.line]):
-            for d in l.directives:
-                if isinstance(d, Start) and d.name == self.name:
-                    d.has_named_end = True
-                    self.start_line = d.line
-                    return
+        #the matching start of a named end is found by find_block_ends
 
 
     def process(self, document, block, index):
@@ -497,6 +531,8 @@ class Fi(NameDirective):
     #@(Fi doc)
     expression = re.compile(r"@fi\((.+)\)")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         del block[index]
 
@@ -528,6 +564,8 @@ class If(NameDirective):
     expression = re.compile(r"@if\((.+)\)")
     priority = 4
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         for j in range(index+1, len(block)):
             d = block[j].directive
@@ -573,6 +611,8 @@ class Define(NameDirective):
     expression = re.compile(r"@define\((.+)\)")
     priority = 1
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         args = self.name.split(",")
         name = args.pop(0).strip()
@@ -592,7 +632,7 @@ class Define(NameDirective):
             document.add_error(self.line, "No enifed for define %s" % name)
             return
 
-        document.macros[name] = [ l.clone() for l in block[index+1:j] ]
+        document.macros[name] = block[index+1:j]
 
 #@cstart(Enifed)
 class Enifed(NameDirective):
@@ -619,6 +659,8 @@ class Enifed(NameDirective):
 
     expression = re.compile(r"@enifed\((.+)\)")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         del block[index]
 
@@ -656,6 +698,8 @@ class Subst(NameDirective):
     expression = re.compile(r"@subst\((.+?)\)")
     priority = 2
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         line = block[index]
 
@@ -673,9 +717,7 @@ class Subst(NameDirective):
 
         if isinstance(subst, str):
             #inline substitution
-            l = line.clone()
-            l.text = line.text.replace("@subst(%s)" % self.name, subst)
-            block[index] = l
+            block[index] = line.modified(text=line.text.replace("@subst(%s)" % self.name, subst))
         else:
             ln = line.index
             block[index:index+1] = [ l.clone(self.line+j)\
@@ -712,6 +754,7 @@ class Include(NameDirective):
     #@(Include doc)
     expression = re.compile(r"@include\((.+)\)")
 
+    __slots__ = ()
 
     def process(self, document, block, index):
         #check if the name contains 2 arguments
@@ -723,13 +766,15 @@ class Include(NameDirective):
         if args:
             #a file name is given, fetch block from that file
             fname = args[0].strip()
-            subdoc = document.get_subdoc(fname)
-            if subdoc:
-                include = subdoc.get_compiled_block(name)
-            else:
-                include = None
+            source = document.get_subdoc(fname)
         else:
-            include = document.get_compiled_block(name)
+            source = document
+
+        include = None
+        if source:
+            #the budget stops include cycles and runaway expansions
+            with document.budget.include(source, name, block[index]):
+                include = source.get_compiled_block(name)
 
         if not include:
             #print "error include", self.line, name
@@ -737,9 +782,11 @@ class Include(NameDirective):
                                "Cannot find text block: %s" % name)
             return
 
+        document.budget.add_lines(len(include), block[index])
+
         #replace the directive with its content
         indent = block[index].indent
-        include = [ l.clone().change_indent(indent) for l in include ]
+        include = [ l.modified(indent) for l in include ]
         block[index:index+1] = include
 
 
@@ -774,6 +821,8 @@ class RInclude(Include):
     #@(RInclude doc)
     expression = re.compile(r"@rinclude\((.+)\)")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         l = block[index]
         super(RInclude, self).process(document, block, index)
@@ -808,6 +857,8 @@ class Edoc(Directive):
     #@(Edoc doc)
     expression = re.compile(r"@edoc")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         del block[index]
 
@@ -845,6 +896,8 @@ class Code(Directive):
     #@(Code doc)
     expression = re.compile(r"@code")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         line = block[index]
 
@@ -855,7 +908,7 @@ class Code(Directive):
             if isinstance(l.directive, Edoc):
                 break
 
-            block[j] = l.clone().change_indent(4).set(type='c')
+            block[j] = l.modified(4, type='c')
 
         #insert the rst prefix
         sd = [Subst(self.line, "__codeprefix__")]
@@ -894,6 +947,8 @@ class Ignore(Directive):
     #@(Ignore doc)
     expression = re.compile("@ignore")
 
+    __slots__ = ()
+
     def process(self, document, block, index):
         del block[index]
 
@@ -922,15 +977,15 @@ class Indent(Directive):
     #@(Indent doc)
     expression = re.compile("@indent\s+([+-]?\d+)")
 
+    __slots__ = ("indent",)
+
     def __init__(self, line, mo):
         super(Indent, self).__init__(line, mo)
         self.indent = int(mo.group(1))
 
 
     def process(self, document, block, index):
-        lines = [ l.clone().change_indent(self.indent)
-                  for l in block[index+1:] ]
-        block[index:] = lines
+        block[index:] = [ l.modified(self.indent) for l in block[index+1:] ]
 
 
 #@(Indent)
@@ -953,6 +1008,168 @@ directives = {
     "rinclude" : RInclude,
     }
 
+#@cstart(DirectiveScanner)
+class DirectiveScanner(object):
+    #@start(DirectiveScanner doc)
+    #DirectiveScanner
+    #================
+    """
+    .. py:class:: DirectiveScanner(directives)
+
+       Finds the directives of a text in a single pass.
+
+       Every directive expression starts with ``@``. Therefore only the positions of ``@``
+       are examined and a text without ``@`` is skipped at once. At each position only the
+       expressions that can match the following character are tried.
+       The result is the same as calling ``finditer`` of each directive expression in the
+       order of the ``directives`` dictionary.
+
+       :param dict directives: A dictionary of directive classes.
+    """
+    #@indent 3
+    #@include(DirectiveScanner)
+    #@include(DirectiveScanner.scan doc)
+    #@(DirectiveScanner doc)
+
+    def __init__(self, directives):
+        ranked = list(enumerate(directives.values()))
+
+        #expressions that do not start with "@" and a letter (e.g. End) are tried at every position
+        self._any = [ (rank, d) for rank, d in ranked if not _first_letter(d.expression) ]
+
+        #first letter after "@" -> list of (rank, directive class)
+        self._by_letter = {}
+        for rank, d in ranked:
+            letter = _first_letter(d.expression)
+            if letter:
+                self._by_letter.setdefault(letter, list(self._any)).append((rank, d))
+
+        for candidates in self._by_letter.values():
+            candidates.sort(key=operator.itemgetter(0))
+
+    #@cstart(DirectiveScanner.scan)
+    def scan(self, text):
+        """
+        .. py:method:: scan(text)
+
+           :param string text: The text to search in.
+           :return: A list of tuples ``(directive class, match object)``.
+        """
+        pos = text.find("@")
+        if pos < 0:
+            return []
+
+        found = []
+
+        #rank -> end of the last match, matches of one expression do not overlap (like finditer)
+        last_end = {}
+
+        while pos >= 0:
+            for rank, directive in self._by_letter.get(text[pos+1:pos+2], self._any):
+                if pos < last_end.get(rank, 0):
+                    continue
+
+                mo = directive.expression.match(text, pos)
+                if mo:
+                    found.append((rank, pos, directive, mo))
+                    last_end[rank] = mo.end()
+
+            pos = text.find("@", pos + 1)
+
+        found.sort(key=operator.itemgetter(0, 1))
+        return [ (directive, mo) for rank, pos, directive, mo in found ]
+
+    #@(DirectiveScanner.scan)
+
+def _first_letter(expression):
+    pattern = expression.pattern
+    if pattern[:1] == "@" and pattern[1:2].isalpha():
+        return pattern[1]
+
+    return None
+
+scanner = DirectiveScanner(directives)
+
+#@cstart(find_block_ends)
+def find_block_ends(lines):
+    #@start(find_block_ends doc)
+    #find_block_ends
+    #===============
+    """
+    .. py:function:: find_block_ends(lines)
+
+       Matches the start and end directives of a source file in a single pass.
+       It is called by :py:meth:`Reader._post_process`.
+
+         * A named end (``@(name)``) is matched with the nearest preceding start directive
+           with the same name. The start is informed by :py:attr:`Start.has_named_end`.
+         * The :py:attr:`Start.end_line` of each start directive is set according to
+           the ending rules of :py:class:`Start`.
+
+       :param list lines: A list of all document lines. The :py:attr:`Directive.line`
+                          attributes must be the indices of the lines.
+    """
+    #@include(find_block_ends)
+    #@(find_block_ends doc)
+
+    #name -> the nearest start directive with this name
+    named_starts = {}
+    for l in lines:
+        for d in l.directives:
+            if isinstance(d, End) and d.name is not None and d.name in named_starts:
+                start = named_starts[d.name]
+                start.has_named_end = True
+                d.start_line = start.line
+
+        found = set()
+        for d in l.directives:
+            if isinstance(d, Start) and d.name not in found:
+                found.add(d.name)
+                named_starts[d.name] = d
+
+    #the starts without a found end: (start directive, start indent)
+    open_starts = []
+
+    #name -> the starts with a named end, waiting for their end
+    waiting = {}
+
+    for j, l in enumerate(lines):
+        d = l.directive
+
+        if open_starts:
+            lindent = l.indent
+            still_open = []
+            for start, start_indent in open_starts:
+                if start._is_ended_by(l, lindent, start_indent):
+                    start.end_line = j
+                else:
+                    still_open.append((start, start_indent))
+
+            open_starts = still_open
+
+        if isinstance(d, End) and d.name in waiting:
+            #a named end overrides all other ending rules
+            ended = waiting.pop(d.name)
+            for start in ended:
+                start.end_line = j
+
+            open_starts = [ (s, i) for s, i in open_starts if s not in ended ]
+
+        for start in l.directives:
+            if isinstance(start, Start):
+                start.end_line = None
+                open_starts.append((start, l.indent))
+
+                if start.has_named_end:
+                    waiting.setdefault(start.name, []).append(start)
+
+    for start, start_indent in open_starts:
+        #case 1: The end of the file
+        start.end_line = len(lines)
+
+    #the named starts without a named end keep the end of the other rules
+    #@(find_block_ends)
+
 #@(directives)
 """
 @start(__macros__)
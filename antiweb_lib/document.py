@@ -6,11 +6,19 @@ __maintainer__ = "antiweb team"
 __email__ = "antiweb@freelists.org"
 
 import os
+import copy
+import time
+import bisect
 import operator
 import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
 
 
 from antiweb_lib.readers.Line import Line
+from antiweb_lib.profiling import phase
+from antiweb_lib.fileutil import stat_file
 from antiweb_lib.readers.config import get_reader_for_file
 
 
@@ -28,6 +36,9 @@ Document
 ********
 
 @include(Document doc)
+@include(ExpansionBudget doc)
+@include(DirectiveSchedule doc)
+@include(SubdocCache doc)
 @include(Line doc, readers\Line.py)
 """
 #@rstart(document)
@@ -44,7 +55,7 @@ class Document(object):
     #========
 
     """
-    .. py:class:: Document(text, reader, fname, tokens)
+    .. py:class:: Document(text, reader, fname, tokens[, lines, budget])
 
        This is the mediator communicating with all other classes
        to generate rst output.
@@ -52,23 +63,29 @@ class Document(object):
        :param reader: An instance of :py:class:`Reader`.
        :param string fname: The file name of the source code.
        :param tokens: A sequence of tokens usable for the ``@if`` directive.
+       :param lines: The already processed lines of the text.
+       :param budget: The :py:class:`ExpansionBudget` of the document.
     """
 
     #@indent 3
     #@include(Document)
     #@include(Document.errors doc)
+    #@include(Document.warnings doc)
     #@include(Document.blocks doc)
     #@include(Document.blocks_included doc)
     #@include(Document.compiled_blocks doc)
     #@include(Document.sub_documents doc)
+    #@include(Document.included_files doc)
     #@include(Document.tokens doc)
     #@include(Document.macros doc)
+    #@include(Document.budget doc)
     #@include(Document.fname doc)
     #@include(Document.reader doc)
     #@include(Document.lines doc)
     #@include(Document.__init__ doc)
     #@include(Document.process doc)
     #@include(Document.get_subdoc doc)
+    #@include(Document.get_dependencies doc)
     #@include(Document.add_error doc)
     #@include(Document.check_errors doc)
     #@include(Document.collect_blocks doc)
@@ -83,6 +100,14 @@ class Document(object):
 
        A list of errors found during generation.
     """
+    #@cstart(Document.warnings)
+    warnings = []
+    """
+    .. py:attribute:: warnings
+
+       A list of the warning texts of :py:meth:`process` (e.g. text blocks that were not included).
+       The warnings are also written via the logging module.
+    """
     #@cstart(Document.blocks)
     blocks = {}
     """
@@ -114,6 +139,16 @@ class Document(object):
        A cache dictionary of sub documents, referenced by
        ``@include`` directives: Filename -> Document
     """
+    #@cstart(Document.included_files)
+    included_files = set()
+    """
+    .. py:attribute:: included_files
+
+       A set of the absolute paths of all files, that were
+       read by ``@include`` directives of this document. A file that
+       could not be read is contained too, so creating it regenerates
+       the document.
+    """
     #@cstart(Document.tokens)
     tokens = set()
     """
@@ -129,6 +164,14 @@ class Document(object):
        A dictionary containing the macros that can be used
        by the ``@subst`` directive: Macro name -> substitution.
     """
+    #@cstart(Document.budget)
+    budget = None
+    """
+    .. py:attribute:: budget
+
+       The :py:class:`ExpansionBudget` limiting the ``@include`` expansion.
+       It is shared by the document and all its sub documents.
+    """
     #@cstart(Document.fname)
     fname = ""
     """
@@ -155,23 +198,30 @@ class Document(object):
 
     #Methods
     #@cstart(Document.__init__)
-    def __init__(self, text, reader, fname, tokens):
+    def __init__(self, text, reader, fname, tokens, lines=None, budget=None):
         """
-        .. py:method:: __init__(text, reader, fname, tokens)
+        .. py:method:: __init__(text, reader, fname, tokens[, lines, budget])
 
            The constructor.
+           :param lines: The already processed lines of the text (e.g. from the :py:class:`SubdocCache`).
+                         If they are given, the text is not processed again.
+           :param budget: An :py:class:`ExpansionBudget`. If it is None, a budget with the
+                          default limits is used.
         """
         self.errors = []
+        self.warnings = []
         self.blocks = {}
         self.blocks_included = set()
         self.compiled_blocks = set()
         self.sub_documents = {}
+        self.included_files = set()
         self.tokens = set(tokens or [])
         self.macros = { "__file__" : os.path.split(fname)[-1],
                         "__codeprefix__" : "" }
+        self.budget = budget or ExpansionBudget()
         self.fname = fname
         self.reader = reader
-        self.lines = self.reader.process(fname, text)
+        self.lines = self.reader.process(fname, text) if lines is None else lines
 
 
     #@cstart(Document.process)
@@ -209,11 +259,13 @@ class Document(object):
                 warnings.sort(key=operator.itemgetter(0))
                 for l, w in warnings:
                     logger.warning("  %s(line %i)", w, l)
+                    self.warnings.append("block not included: %s(line %i)" % (w, l))
             #@
-        text = self.reader.filter_output(text)
-        return_text = None
-        if text:
-             return_text = "\n".join(map(operator.attrgetter("text"), text))
+        with phase("filter"):
+            text = self.reader.filter_output(text)
+            return_text = None
+            if text:
+                return_text = "\n".join(map(operator.attrgetter("text"), text))
         return return_text
     #@edoc
     #@rinclude(show warnings)
@@ -247,19 +299,32 @@ class Document(object):
         head, tail = os.path.split(self.fname)
         fpath = os.path.join(head, rpath)
 
-        try:
-            #print "try open", fpath
-            with open(fpath, "r") as f:
-                text = f.read()
-        except IOError:
+        #a missing file is a dependency too: the document changes when it is created
+        self.included_files.add(os.path.abspath(fpath))
+
+        #the file may already be lexed for another document (see SubdocCache)
+        reader = get_reader_for_file(fpath)
+        lines = subdoc_cache.lookup(fpath, reader, rpath)
+        text = None
+
+        if lines is None:
+            stat = stat_file(fpath)
+            try:
+                #print "try open", fpath
+                with phase("read"), open(fpath, "r") as f:
+                    text = f.read()
+            except IOError:
+                logger.error("Could not open: %s", fpath)
+
+        if lines is None and text is None:
             doc = None
-            logger.error("Could not open: %s", fpath)
 
         else:
             #parse the file
-            reader = get_reader_for_file(fpath)
+            doc = Document(text, reader, rpath, self.tokens, lines, self.budget)
+            if lines is None:
+                subdoc_cache.store(fpath, reader, stat, doc.lines)
 
-            doc = Document(text, reader, rpath, self.tokens)
             doc.collect_blocks()
             insert_macros(doc)
         #@
@@ -272,6 +337,23 @@ class Document(object):
     #@rinclude(insert macros function)
     #@rinclude(read the source file)
     #@(Document.get_subdoc)
+    #@cstart(Document.get_dependencies)
+    def get_dependencies(self):
+        """
+        .. py:method:: get_dependencies()
+
+           Returns all files the document depends on: the files read
+           by its own ``@include`` directives and the files those
+           sub documents depend on.
+           :return: A set of absolute file paths.
+        """
+        dependencies = set(self.included_files)
+        for subdoc in self.sub_documents.values():
+            if subdoc:
+                dependencies.update(subdoc.get_dependencies())
+
+        return dependencies
+
     #@cstart(Document.add_error)
     def add_error(self, line_number, text, fname=""):
         """
@@ -311,11 +393,12 @@ class Document(object):
 
            Collects all text blocks.
         """
-        blocks = [ d.collect_block(self, i)
-                   for i, l in enumerate(self.lines)
-                   for d in l.directives ]
+        with phase("collect"):
+            blocks = [ d.collect_block(self, i)
+                       for i, l in enumerate(self.lines)
+                       for d in l.directives ]
 
-        self.blocks = dict(list(filter(bool, blocks)))
+            self.blocks = dict(list(filter(bool, blocks)))
 
         if "__macros__" in self.blocks:
             self.get_compiled_block("__macros__")
@@ -355,26 +438,396 @@ class Document(object):
            the compiled text block.
 
         """
-        #@cstart(find_next_directive)
-        def find_next_directive(block):
-            # returns the next available directive
-            min_line = [ (l.directives[0].priority, i)
-                         for i, l in enumerate(block) if l.directives ]
-            if not min_line:
-                return None
-
-            prio, index = min(min_line)
-            return block[index].directives.pop(0), index
-        #@(find_next_directive)
+        with phase("compile"):
+            #the directives change the block: the schedule keeps track of the changes
+            schedule = DirectiveSchedule(block)
 
-        while True:
-            directive_index = find_next_directive(block)
-            if not directive_index: break
-            directive, index = directive_index
-            directive.process(self, block, index)
+            while True:
+                directive_index = schedule.next_directive()
+                if not directive_index: break
+                directive, index = directive_index
+                directive.process(self, schedule, index)
 
+            block[:] = schedule
         self.compiled_blocks.add(name)
         return block
-    #@edoc
-    #@rinclude(find_next_directive)
-    #@(Document.compile_block)
\ No newline at end of file
+    #@(Document.compile_block)
+
+
+#@cstart(DirectiveSchedule)
+class DirectiveSchedule(list):
+    #@start(DirectiveSchedule doc)
+    #DirectiveSchedule
+    #=================
+
+    """
+    .. py:class:: DirectiveSchedule(block)
+
+       A list of lines used by :py:meth:`Document.compile_block`.
+       The next directive to process is the first directive of the line with the lowest
+       ``(priority, line index)``. Instead of searching all lines for each directive
+       the schedule keeps the indices of the lines with directives, grouped by priority.
+       All changes of the list by a directive's :py:meth:`process` method are recorded
+       and the indices are updated accordingly.
+
+       :param block: A list of :py:class:`Line` objects.
+    """
+
+    #@indent 3
+    #@include(DirectiveSchedule)
+    #@include(DirectiveSchedule.next_directive doc)
+    #@(DirectiveSchedule doc)
+
+    def __init__(self, block):
+        super(DirectiveSchedule, self).__init__(block)
+        self._rebuild()
+
+    def _rebuild(self):
+        #priority -> sorted list of line indices
+        self._buckets = {}
+        for i, l in enumerate(self):
+            if l.directives:
+                self._buckets.setdefault(l.directives[0].priority, []).append(i)
+
+        #recorded changes: (start, stop, new lines)
+        self._changes = []
+        self._dirty = False
+
+    #@cstart(DirectiveSchedule.next_directive)
+    def next_directive(self):
+        """
+        .. py:method:: next_directive()
+
+           Removes the next directive from its line.
+
+           :return: A tuple ``(directive, line index)`` or ``None`` if there is no directive left.
+        """
+        self._apply_changes()
+        buckets = self._buckets
+
+        while True:
+            candidates = [ (indices[0], priority) for priority, indices in buckets.items() if indices ]
+            if not candidates:
+                return None
+
+            index, priority = min(candidates, key=lambda c: (c[1], c[0]))
+            del buckets[priority][0]
+
+            #the line may have been replaced by one with fewer directives,
+            #so the recorded priority is checked: it can only increase
+            directives = self[index].directives
+            if not directives:
+                continue
+
+            if directives[0].priority != priority:
+                bisect.insort(buckets.setdefault(directives[0].priority, []), index)
+                continue
+
+            #the line may be shared with other blocks: it is replaced instead of changed
+            directive = directives[0]
+            directives = directives[1:]
+            list.__setitem__(self, index, self[index].modified(directives=directives))
+            if directives:
+                bisect.insort(buckets.setdefault(directives[0].priority, []), index)
+
+            return directive, index
+
+    #@(DirectiveSchedule.next_directive)
+
+    def _apply_changes(self):
+        if self._dirty:
+            self._rebuild()
+            return
+
+        for start, stop, lines in self._changes:
+            delta = len(lines) - (stop - start)
+            for indices in self._buckets.values():
+                first = bisect.bisect_left(indices, start)
+                last = bisect.bisect_left(indices, stop)
+                if first == len(indices):
+                    continue
+
+                indices[first:] = [ i + delta for i in indices[last:] ]
+
+            for i, l in enumerate(lines, start):
+                if l.directives:
+                    bisect.insort(self._buckets.setdefault(l.directives[0].priority, []), i)
+
+        self._changes = []
+
+    def _record(self, start, stop, lines):
+        self._changes.append((start, stop, list(lines)))
+
+    def _slice(self, key):
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            self._dirty = True
+            return None
+
+        return start, max(start, stop)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            value = list(value)
+            bounds = self._slice(key)
+            if bounds:
+                self._record(bounds[0], bounds[1], value)
+        else:
+            index = key + len(self) if key < 0 else key
+            self._record(index, index + 1, [value])
+
+        super(DirectiveSchedule, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            bounds = self._slice(key)
+            if bounds:
+                self._record(bounds[0], bounds[1], [])
+        else:
+            index = key + len(self) if key < 0 else key
+            self._record(index, index + 1, [])
+
+        super(DirectiveSchedule, self).__delitem__(key)
+
+    def insert(self, index, line):
+        index = max(0, min(index + len(self) if index < 0 else index, len(self)))
+        self._record(index, index, [line])
+        super(DirectiveSchedule, self).insert(index, line)
+
+    def append(self, line):
+        self._record(len(self), len(self), [line])
+        super(DirectiveSchedule, self).append(line)
+
+    def extend(self, lines):
+        lines = list(lines)
+        self._record(len(self), len(self), lines)
+        super(DirectiveSchedule, self).extend(lines)
+
+    def __iadd__(self, lines):
+        self.extend(lines)
+        return self
+
+    def _changed(method):
+        def changed(self, *args, **kwargs):
+            self._dirty = True
+            return method(self, *args, **kwargs)
+
+        return changed
+
+    #all other changes rebuild the indices
+    pop = _changed(list.pop)
+    remove = _changed(list.remove)
+    clear = _changed(list.clear)
+    sort = _changed(list.sort)
+    reverse = _changed(list.reverse)
+    __imul__ = _changed(list.__imul__)
+    del _changed
+
+#@(DirectiveSchedule)
+
+#@cstart(ExpansionBudget)
+class ExpansionBudget(object):
+    #@start(ExpansionBudget doc)
+    #ExpansionBudget
+    #===============
+
+    """
+    .. py:class:: ExpansionBudget([max_depth, max_lines])
+
+       Limits the expansion of ``@include`` directives of a document and its sub documents.
+       Every inclusion copies the included block, so a document whose blocks include other
+       blocks several times can grow exponentially. Instead of running out of time or memory
+       a ``WebError`` is raised, if
+
+         * the included blocks are nested deeper than ``max_depth`` (see ``--max-include-depth``),
+         * more than ``max_lines`` lines were inserted by ``@include`` directives (see ``--max-lines``),
+         * a block includes itself, directly or by other blocks (an include cycle).
+
+       :param integer max_depth: The maximum nesting depth of included blocks.
+       :param integer max_lines: The maximum number of included lines.
+    """
+    #@indent 3
+    #@include(ExpansionBudget)
+    #@include(ExpansionBudget.include doc)
+    #@include(ExpansionBudget.add_lines doc)
+    #@(ExpansionBudget doc)
+
+    default_max_depth = 50
+    default_max_lines = 1000000
+
+    def __init__(self, max_depth=None, max_lines=None):
+        self.max_depth = max_depth or self.default_max_depth
+        self.max_lines = max_lines or self.default_max_lines
+        self.lines = 0
+        #the blocks being compiled: (file name, block name)
+        self.stack = []
+
+    #@cstart(ExpansionBudget.include)
+    @contextmanager
+    def include(self, document, name, line):
+        """
+        .. py:method:: include(document, name, line)
+
+           A context manager for the compilation of an included block.
+
+           :param document: The :py:class:`Document` of the included block.
+           :param string name: The name of the included block.
+           :param line: The :py:class:`Line` of the ``@include`` directive (used for the error).
+           :raises WebError: If the block is already being compiled or the maximum depth is reached.
+        """
+        key = (document.fname, name)
+        if key in self.stack:
+            cycle = self.stack[self.stack.index(key):] + [key]
+            raise WebError([(line, "Include cycle: %s" % " -> ".join("%s(%s)" % (n, f) for f, n in cycle))])
+
+        if len(self.stack) >= self.max_depth:
+            raise WebError([(line, "Maximum include depth (%i) exceeded: %s" % (self.max_depth, name))])
+
+        self.stack.append(key)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+
+    #@cstart(ExpansionBudget.add_lines)
+    def add_lines(self, count, line):
+        """
+        .. py:method:: add_lines(count, line)
+
+           Counts the lines inserted by an ``@include`` directive.
+
+           :param integer count: The number of inserted lines.
+           :param line: The :py:class:`Line` of the ``@include`` directive (used for the error).
+           :raises WebError: If more than ``max_lines`` lines were inserted.
+        """
+        self.lines += count
+        if self.lines > self.max_lines:
+            raise WebError([(line, "Maximum number of included lines (%i) exceeded" % self.max_lines)])
+
+    #@(ExpansionBudget.add_lines)
+
+#@cstart(SubdocCache)
+class SubdocCache(object):
+    #@start(SubdocCache doc)
+    #SubdocCache
+    #===========
+
+    """
+    .. py:class:: SubdocCache([max_lines])
+
+       A process-wide cache of the processed lines of included files. If many files of a ``-r``
+       run or of the daemon include the same file (``@include`` with a file name), the file is only
+       read and lexed once.
+
+       The cache holds the lines before the blocks are collected and compiled. The compilation
+       depends on the including document (its tokens and the macros copied by ``insert_macros``)
+       and changes the lines. Therefore each sub document gets its own copy of the lines and
+       the token set is not part of the key. The key is the absolute path of the file and the
+       reader with its lexer (the engine, see :ref:`Language <label-language>`).
+
+       An entry is valid as long as the modification time and the size of the file
+       are unchanged. A file modified within the last ``racy_seconds`` is not stored,
+       as a second change might not change its modification time.
+       The least recently used entries are removed, if the cache holds more than ``max_lines`` lines.
+
+       :param integer max_lines: The maximum number of cached lines.
+    """
+    #@indent 3
+    #@include(SubdocCache)
+    #@include(SubdocCache.lookup doc)
+    #@include(SubdocCache.store doc)
+    #@(SubdocCache doc)
+
+    racy_seconds = 2.0
+
+    def __init__(self, max_lines=100000):
+        self.max_lines = max_lines
+        self.line_count = 0
+        #key -> (stat, lines)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    #@cstart(SubdocCache.lookup)
+    def lookup(self, fname, reader, rpath):
+        """
+        .. py:method:: lookup(fname, reader, rpath)
+
+           :param string fname: The path of the included file.
+           :param reader: The reader of the file.
+           :param string rpath: The path of the file in the ``@include`` directive,
+                                it is the file name of the lines.
+           :return: A copy of the cached lines or None.
+        """
+        if reader is None:
+            #the file is not supported
+            return None
+
+        key = _cache_key(fname, reader)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[0] != stat_file(fname):
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+
+        return _copy_lines(entry[1], rpath)
+
+    #@cstart(SubdocCache.store)
+    def store(self, fname, reader, stat, lines):
+        """
+        .. py:method:: store(fname, reader, stat, lines)
+
+           Stores a copy of the processed lines of a file.
+
+           :param string fname: The path of the included file.
+           :param reader: The reader of the file.
+           :param stat: The result of :py:func:`stat_file` taken before the file was read.
+           :param lines: The processed lines.
+        """
+        if (reader is None or stat is None or len(lines) > self.max_lines
+            or stat[0] > (time.time() - self.racy_seconds) * 1e9):
+            return
+
+        key = _cache_key(fname, reader)
+        lines = _copy_lines(lines, None)
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (stat, lines)
+            self.line_count += len(lines)
+
+            while self.line_count > self.max_lines:
+                self._remove(next(iter(self._entries)))
+
+    #@(SubdocCache.store)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.line_count = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.line_count -= len(entry[1])
+
+subdoc_cache = SubdocCache()
+
+def _cache_key(fname, reader):
+    return os.path.abspath(fname), type(reader), type(reader.lexer)
+
+def _copy_lines(lines, fname):
+    #the directives are changed during the compilation: they are copied, too
+    return [ Line(fname if fname is not None else l.fname, l.index, l.text,
+                  [ copy.copy(d) for d in l.directives ], l.type)
+             for l in lines ]
+
+#@(SubdocCache)
@@ -6,10 +6,17 @@ __maintainer__ = "antiweb team"
 __email__ = "antiweb@freelists.org"
 
 from watchdog.events import FileSystemEventHandler
-from antiweb_lib.write import write
-from antiweb_lib.write import create_write_string
+from antiweb_lib.write import write_result, report_result
+from antiweb_lib.write import create_write_string, get_out_file
+from antiweb_lib.profiling import format_profile
 from antiweb_lib.readers.config import is_file_supported
+from antiweb_lib.dependencies import DependencyGraph
 import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger('antiweb')
 
 #@start()
 """
@@ -23,10 +30,15 @@ FileChangeHandler
 
 #@include(process_event doc)
 
+#@include(process_events doc)
+
+#@include(workers doc)
+
 -   events 'created', 'modified', 'moved' and 'deleted' are handled by the process_event method
 -   event 'moved' is triggered when a subdirectory of the monitored source directory
     contains monitored files and the subdirectory is renamed
--   note that when a file is modified/created watchdog may get multiple events
+-   note that when a file is modified/created watchdog may get multiple events, these
+    events are collected during the debounce window (``--debounce-ms``) and processed once
 
 #@include(file_events)
 
@@ -36,26 +48,77 @@ FileChangeHandler
 class FileChangeHandler(FileSystemEventHandler):
     #@start(FileChangeHandler doc)
     """
-    .. py:class:: FileChangeHandler(directory, extensions, options)
+    .. py:class:: FileChangeHandler(directory, options, created_files[, graph])
 
        This handler is responsible for handling changed file events in antiweb's daemon mode.
 
        :param string directory: absolute path to the monitored source directory
        :param options: antiweb commandline options
        :param created_files: a set which contains the absolute paths of all previously created documentation files
+       :param graph: the :py:class:`DependencyGraph` of the previously created documentation files
+
+       The events are not processed immediately. A batch of events is processed after no further event
+       was received for ``options.debounce_ms`` milliseconds, but at the latest ``max_debounce_windows``
+       debounce windows after its first event. If the debounce window is 0 each event is processed immediately.
+
+       The documentation files are not created in the observer thread. They are put into a bounded
+       queue, which is processed by ``options.daemon_workers`` worker threads.
 
     """
     #@include(FileChangeHandler)
 
     #@(FileChangeHandler doc)
 
-    def __init__(self, directory, options, created_files):
+    #the maximum number of queued files, further files wait until a worker is ready
+    max_queued = 256
+
+    #a batch is processed after this many debounce windows, even if further events arrive
+    max_debounce_windows = 10
+
+    def __init__(self, directory, options, created_files, graph=None):
         self._directory = directory
         #antiweb commandline options
         self._options = options
         self._event_counter = 0
         self._created_files = set()
         self._created_files.update(created_files)
+        self._graph = graph if graph is not None else DependencyGraph()
+        self._quiet = getattr(options, "quiet", False)
+        #the results of the regenerated files, only kept for the --report and --profile options
+        self.results = []
+
+        #the debounce window in seconds
+        self._debounce = max(getattr(options, "debounce_ms", 0) or 0, 0) / 1000.0
+        #the collected events of the current batch: changed file -> last event
+        self._pending_events = {}
+        #the batch is processed at the deadline, which is postponed by each event up to the maximum deadline
+        self._deadline = 0.0
+        self._max_deadline = 0.0
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+        #the files to regenerate: (file, time stamp) or None to stop a worker
+        self._queue = queue.Queue(self.max_queued)
+        #the files in the queue
+        self._queued = set()
+        #the files processed by a worker
+        self._running = set()
+        #files changed while they were processed: file -> time stamp
+        self._rerun = {}
+
+        self._workers = []
+        for i in range(max(getattr(options, "daemon_workers", 1) or 1, 1)):
+            worker = threading.Thread(target=self._work, name="antiweb-worker-%i" % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        self._flusher = None
+        if self._debounce:
+            self._flusher = threading.Thread(target=self._flush, name="antiweb-flusher")
+            self._flusher.daemon = True
+            self._flusher.start()
 
 #@cstart(process_event)
 
@@ -64,11 +127,16 @@ class FileChangeHandler(FileSystemEventHandler):
         """
 .. py:method:: process_event(self, event)
 
-   Handles the file events: 'modified' | 'created' | 'moved' | 'deleted'.
+   Collects the file events: 'modified' | 'created' | 'moved' | 'deleted'.
 
-   The events trigger an update of the corresponding documentation file.
-   Ignored events are: deleted files, changed directories, files without a handled extension and changes of
-   antiweb's created documentation files.
+   The event is added to the current batch, only the last event of a file is kept.
+   The batch is processed by :py:meth:`process_events` when the debounce window elapsed
+   without a new event. This way the many events of a single editor save or a ``git checkout``
+   only regenerate each documentation file once. A steady stream of events does not postpone
+   the batch forever: it is processed ``max_debounce_windows`` debounce windows after its first event.
+
+   The batches are processed by a single flusher thread, which waits until the deadline of the
+   current batch.
 
    :param event: The file event that should be handled. Possible event types: 'modified' | 'created' | 'moved' | 'deleted'
         """
@@ -76,36 +144,264 @@ class FileChangeHandler(FileSystemEventHandler):
 #@include(process_event)
 #@(process_event doc)
 
-        self._event_counter += 1
-        time_stamp = "[" + time.strftime('%H:%M:%S') + " " + str(self._event_counter).zfill(5) + "] "
+        if not self._debounce:
+            self.process_events([event])
+            return
+
+        with self._condition:
+            now = time.monotonic()
 
-        changed_file = event.src_path
+            if not self._pending_events:
+                #a new batch: wake up the flusher
+                self._max_deadline = now + self._debounce * self.max_debounce_windows
+                self._condition.notify()
 
-        if event.event_type == "moved":
-            #moved event has to be handled differently:
-            #the file has been moved so it is now located in event.dest_path
-            changed_file = event.dest_path
+            self._pending_events[_changed_file(event)] = event
 
-        ignore_change = changed_file in self._created_files or not is_file_supported(changed_file) or \
-                  event.is_directory or event.event_type == "deleted"
+            #restart the debounce window
+            self._deadline = min(now + self._debounce, self._max_deadline)
 
-        if not ignore_change:
-            #process change
-            created_file = write(self._directory, changed_file, self._options, False)
+    def _flush(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    timeout = None
+                    if self._pending_events:
+                        timeout = self._deadline - time.monotonic()
+                        if timeout <= 0:
+                            break
 
-            if created_file:
-                self._created_files.add(created_file)
+                    self._condition.wait(timeout)
 
-            event_string = create_write_string(changed_file, created_file)
-        else:
-            #ignore change
-            event_string = "Ignored change: " + changed_file + " [" + event.event_type + "]"
+                if self._stopped:
+                    return
 
-        #using autoflush to immediately print the output
-        print(time_stamp + event_string, flush=True)
+                events = list(self._pending_events.values())
+                self._pending_events = {}
+
+            self.process_events(events)
 
 #@(process_event)
 
+#@cstart(process_events)
+
+    def process_events(self, events):
+#@start(process_events doc)
+        """
+.. py:method:: process_events(self, events)
+
+   Handles a batch of file events.
+
+   The events trigger an update of the corresponding documentation file and of all documentation files
+   whose source includes the changed file (see :ref:`Dependency Graph <label-dependencies>`).
+   Each documentation file is updated only once per batch.
+   Ignored events are: deleted files, changed directories, files without a handled extension and changes of
+   antiweb's created documentation files. The files including a deleted file are updated nevertheless.
+
+   :param events: The file events that should be handled.
+        """
+
+#@include(process_events)
+#@(process_events doc)
+
+        with self._lock:
+            self._event_counter += 1
+            time_stamp = "[" + time.strftime('%H:%M:%S') + " " + str(self._event_counter).zfill(5) + "] "
+
+            changed_files = []
+            deleted_files = []
+            files = set()
+
+            for event in events:
+                changed_file = _changed_file(event)
+
+                if event.is_directory or changed_file in self._created_files:
+                    is_handled = False
+                elif event.event_type == "deleted":
+                    deleted_files.append(changed_file)
+                    #the files including the deleted file are outdated nevertheless
+                    is_handled = bool(self._graph.affected([changed_file]))
+                else:
+                    changed_files.append(changed_file)
+                    if is_file_supported(changed_file):
+                        files.add(changed_file)
+                        is_handled = True
+                    else:
+                        is_handled = bool(self._graph.affected([changed_file]))
+
+                if not is_handled and not self._quiet:
+                    #ignore change
+                    event_string = "Ignored change: " + changed_file + " [" + event.event_type + "]"
+                    print(time_stamp + event_string, flush=True)
+
+            #the files including the changed files are outdated too
+            outdated = self._graph.affected(changed_files + deleted_files)
+            files.update(outdated - set(deleted_files))
+
+            for deleted_file in deleted_files:
+                self._graph.remove(deleted_file)
+
+        for file in sorted(files):
+            self._enqueue(file, time_stamp)
+
+#@(process_events)
+
+#@cstart(workers)
+
+    def _enqueue(self, file, time_stamp):
+#@start(workers doc)
+        """
+.. py:method:: _enqueue(self, file, time_stamp)
+
+   Queues a file for regeneration.
+
+   A file that is already queued is not queued again. A file that is currently processed by a worker
+   is processed again by the same worker after it finished, so a file is never written by two workers at once.
+   If the queue is full the calling thread is blocked until a worker takes the next file.
+   If a file cannot be processed the error is logged and the worker continues with the next file.
+        """
+#@include(workers)
+#@(workers doc)
+
+        with self._lock:
+            if self._stopped:
+                return
+
+            if file in self._running:
+                self._rerun[file] = time_stamp
+                return
+
+            if file in self._queued:
+                return
+
+            self._queued.add(file)
+
+        #blocks if the queue is full
+        self._queue.put((file, time_stamp))
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+
+            try:
+                if job is None:
+                    return
+
+                file, time_stamp = job
+
+                with self._lock:
+                    self._queued.discard(file)
+                    self._running.add(file)
+
+                try:
+                    while time_stamp:
+                        try:
+                            self._regenerate(file, time_stamp)
+                        except SystemExit:
+                            #the error was already logged (e.g. the documentation directory could not be created)
+                            pass
+                        except Exception as e:
+                            #a failing file must not stop the worker
+                            logger.error("\nError: %s could not be processed: %s", file, e)
+
+                        with self._lock:
+                            time_stamp = self._rerun.pop(file, None)
+                            if not time_stamp:
+                                self._running.discard(file)
+                finally:
+                    if time_stamp:
+                        #the loop was left by an error: later changes of the file must not wait for this worker
+                        with self._lock:
+                            self._running.discard(file)
+                            self._rerun.pop(file, None)
+            finally:
+                self._queue.task_done()
+
+    def _regenerate(self, file, time_stamp):
+        out_file = get_out_file(self._directory, file, self._options)
+
+        with self._lock:
+            #the events of the output file may arrive before write_result returns,
+            #they must not be handled as a changed source
+            was_created = out_file in self._created_files
+            self._created_files.add(out_file)
+
+        try:
+            result = write_result(self._directory, file, self._options)
+        except BaseException:
+            with self._lock:
+                if not was_created:
+                    self._created_files.discard(out_file)
+            raise
+
+        with self._lock:
+            report_result(result, False)
+            self._graph.update(result)
+
+            if result.out_file:
+                self._created_files.add(result.out_file)
+            elif not was_created:
+                self._created_files.discard(out_file)
+
+            if getattr(self._options, "report", "") or result.profile is not None:
+                self.results.append(result)
+
+            if self._quiet:
+                return
+
+            #using autoflush to immediately print the output
+            print(time_stamp + create_write_string(file, result.out_file, result.unchanged), flush=True)
+
+            if result.profile is not None:
+                print(format_profile([result]), flush=True)
+
+    def join(self):
+        """
+.. py:method:: join(self)
+
+   Waits until all queued files are processed.
+        """
+        self._queue.join()
+
+    def stop(self):
+        """
+.. py:method:: stop(self)
+
+   Stops the handler: the pending events and queued files are discarded, the files
+   currently processed are finished. Returns when all workers are stopped.
+        """
+        with self._condition:
+            self._stopped = True
+            self._pending_events = {}
+            self._rerun = {}
+            self._condition.notify()
+
+        #a flusher blocked by the full queue is released by discarding the queued files
+        self._discard_queued()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._discard_queued()
+
+        for worker in self._workers:
+            self._queue.put(None)
+
+        for worker in self._workers:
+            worker.join()
+
+    def _discard_queued(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            self._queue.task_done()
+
+        with self._lock:
+            self._queued = set()
+
+#@(workers)
+
 
 #@cstart(file_events)
 
@@ -126,4 +422,12 @@ class FileChangeHandler(FileSystemEventHandler):
 
 #@(file_events)
 
+def _changed_file(event):
+    if event.event_type == "moved":
+        #moved event has to be handled differently:
+        #the file has been moved so it is now located in event.dest_path
+        return event.dest_path
+
+    return event.src_path
+
 #@
@@ -0,0 +1,78 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import os
+import json
+import tempfile
+
+#@start()
+"""
+.. _label-fileutil:
+
+##############
+File Utilities
+##############
+
+The file functions shared by the :ref:`Build Cache <label-build-cache>`,
+the :ref:`Dependency Graph <label-dependencies>` and the :ref:`Run Report <label-report>`.
+
+#@include(stat_file doc)
+
+#@include(write_json doc)
+"""
+
+#@cstart(stat_file)
+def stat_file(fname):
+#@start(stat_file doc)
+    """
+.. py:function:: stat_file(fname)
+
+   Returns the state of a file, that is compared to find out if a file changed.
+
+   :param string fname: The path of the file.
+   :return: The list ``[mtime_ns, size]`` or None if the file does not exist.
+            A list is returned, so a state loaded from json is equal to a new one.
+    """
+#@include(stat_file)
+#@(stat_file doc)
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+
+    return [stat.st_mtime_ns, stat.st_size]
+#@(stat_file)
+
+#@cstart(write_json)
+def write_json(fname, data, **kwargs):
+#@start(write_json doc)
+    """
+.. py:function:: write_json(fname, data, **kwargs)
+
+   Writes the data as a json file. The data is written to a temporary file first, which
+   replaces the file at once, so a concurrent reader never sees a partial file.
+   If the file cannot be written the temporary file is removed.
+
+   :param string fname: The path of the json file.
+   :param data: The data to write.
+   :param kwargs: The keyword arguments of ``json.dump``.
+   :raises OSError: If the file cannot be written.
+    """
+#@include(write_json)
+#@(write_json doc)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(fname), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(temp_path, fname)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+#@(write_json)
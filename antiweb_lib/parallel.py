@@ -0,0 +1,193 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import logging
+from collections import deque
+
+from antiweb_lib.write import write_result, report_result, get_out_file
+from antiweb_lib.readers.config import set_engines
+
+logger = logging.getLogger('antiweb')
+
+#@start()
+"""
+.. _label-parallel:
+
+###################
+Parallel Processing
+###################
+
+#@include(write_files doc)
+
+#@include(_write_parallel doc)
+
+#@include(worker)
+"""
+
+#@cstart(write_files)
+def write_files(directory, files, options, created_files):
+#@start(write_files doc)
+    """
+.. py:method:: write_files(directory, files, options, created_files)
+
+   Creates the documentation files for all given input files. This is the processing loop of the
+   recursive mode (``-r``). The files are processed in the given order, so rst files have to be
+   at the end of ``files``: they might be the documentation file of a file that is not yet processed.
+   A file that was already created as an output by a previous file is skipped.
+
+   If the ``--jobs`` option is greater than 1 the files are processed by a pool of worker processes
+   (see :py:meth:`_write_parallel`). The result is the same as the sequential processing.
+
+   :param string directory: The absolute path of the processed directory.
+   :param list files: The absolute paths of the files to process.
+   :param options: Commandline options.
+   :param set created_files: The absolute paths of the already created documentation files.
+                             The paths of the newly created files are added.
+   :return: A list containing the :py:class:`WriteResult` of each processed file in input order.
+    """
+#@include(write_files)
+#@(write_files doc)
+
+    if options.jobs > 1:
+        return _write_parallel(directory, files, options, created_files)
+
+    results = []
+
+    for file in files:
+        if not file in created_files:
+            result = write_result(directory, file, options)
+            report_result(result, not getattr(options, "quiet", False))
+            results.append(result)
+
+            if result.out_file:
+                created_files.add(result.out_file)
+
+    return results
+#@(write_files)
+
+#@cstart(_write_parallel)
+def _write_parallel(directory, files, options, created_files):
+#@start(_write_parallel doc)
+    """
+.. py:method:: _write_parallel(directory, files, options, created_files)
+
+   Processes the files with ``options.jobs`` worker processes.
+
+   To be deterministic the sequential rules are kept:
+
+     * A file that is the output of a previous file is only processed if the
+       previous file could not be written. Therefore it waits for that previous file.
+     * If two files write the same output file, the second one waits for the first one.
+       The last file wins, just like in the sequential processing.
+     * Messages and errors of each file are reported in input order.
+
+   :return: A list containing the :py:class:`WriteResult` of each processed file in input order.
+    """
+#@include(_write_parallel)
+#@(_write_parallel doc)
+
+    #imported here: multiprocessing is not needed for a sequential run
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+
+    #the futures in input order, which are not yet reported
+    pending = deque()
+
+    #the future of the last submitted file writing an output: output file -> future
+    producers = {}
+
+    #output files of finished producers which have been replaced by a later producer
+    written = set()
+
+    def report(future):
+        result = future.result()
+        report_result(result, not getattr(options, "quiet", False))
+        results.append(result)
+
+        if result.out_file:
+            created_files.add(result.out_file)
+
+    def report_done():
+        while pending and pending[0].done():
+            report(pending.popleft())
+
+    level = logger.getEffectiveLevel()
+
+    with ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        for file in files:
+            producer = producers.get(file)
+            if (file in created_files or file in written
+                or (producer is not None and producer.result().out_file)):
+                #the file was created by a previous file
+                continue
+
+            out_file = get_out_file(directory, file, options)
+            producer = producers.get(out_file)
+            if producer is not None and producer.result().out_file:
+                #do not write the same file concurrently
+                written.add(out_file)
+
+            future = executor.submit(_write_job, directory, file, options, level)
+            producers[out_file] = future
+            pending.append(future)
+            report_done()
+
+        while pending:
+            report(pending.popleft())
+
+    return results
+#@(_write_parallel)
+
+#@start(worker)
+
+#Worker Processes
+#================
+
+#The worker processes must not log directly, otherwise the messages of different files
+#would be mixed up. All messages of the ``antiweb`` logger are collected in a list instead and
+#sent back with the :py:class:`WriteResult`. The engines of the ``--engine`` option are selected
+#in each worker process, as a worker does not have to be a fork of the main process. A worker is set
+#up by its first job (the initializer of ``ProcessPoolExecutor`` needs Python 3.7).
+
+#@code
+
+_log_records = []
+
+class _RecordCollector(logging.Handler):
+    def emit(self, record):
+        _log_records.append((record.levelno, record.getMessage()))
+
+
+#the (level, engines) the worker process was set up with
+_worker_settings = None
+
+def _init_worker(level, engine):
+    global _worker_settings
+
+    if _worker_settings == (level, engine):
+        return
+
+    _worker_settings = (level, engine)
+    set_engines(engine)
+
+    worker_logger = logging.getLogger('antiweb')
+    worker_logger.handlers = [_RecordCollector()]
+    worker_logger.propagate = False
+    worker_logger.setLevel(level)
+
+
+def _write_job(directory, file, options, level):
+    _init_worker(level, options.engine)
+
+    del _log_records[:]
+    result = write_result(directory, file, options)
+    result.log_records = list(_log_records)
+    return result
+
+#@edoc
+#@(worker)
@@ -0,0 +1,220 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('antiweb')
+
+#@start()
+"""
+.. _label-profiling:
+
+#########
+Profiling
+#########
+
+With the ``--profile`` option antiweb measures the time of each processing phase
+of each file and prints a table after the run:
+
+  ============== ==========================================================
+  Phase          Measured code
+  ============== ==========================================================
+  ``read``       Reading the source files (:py:meth:`generate`, ``@include`` files).
+  ``lex``        Finding the comments by the lexer in :py:meth:`Reader.process`.
+  ``directives`` Matching the directives in :py:meth:`Reader._post_process`.
+  ``collect``    :py:meth:`Document.collect_blocks`.
+  ``compile``    :py:meth:`Document.compile_block`.
+  ``filter``     :py:meth:`Reader.filter_output` and joining the output lines.
+  ``write``      Writing the output file.
+  ============== ==========================================================
+
+The phases can be nested, e.g. an ``@include`` directive reads and lexes a file while
+a block is compiled. The time of a nested phase is only counted for the nested phase.
+The column ``total`` contains the time of the whole file, including the parts which do
+not belong to a phase (e.g. the build cache).
+
+The ``--profile-json`` option writes the timings to a json file. The ``--cprofile`` option
+runs antiweb with ``cProfile`` and writes the statistics to a file, which can be read by
+the ``pstats`` module. With the ``--jobs`` option only the main process is captured by
+``cProfile``, the timings of the phases are measured in the worker processes.
+
+In daemon mode the timings of each regenerated file are printed after its message.
+The table and the json file of the whole run are written when the daemon exits and
+contain the regenerated files, too (the json file the last timings of each file).
+
+#@include(Profile doc)
+
+#@include(profiled doc)
+
+#@include(phase doc)
+
+#@include(format_profile doc)
+
+#@include(save_profile doc)
+"""
+
+#the phases in processing order
+phases = ("read", "lex", "directives", "collect", "compile", "filter", "write")
+
+#the profile of the file processed by the current thread
+_local = threading.local()
+
+#@cstart(Profile)
+class Profile(object):
+    #@start(Profile doc)
+    """
+    .. py:class:: Profile()
+
+       The timings of one processed file. A profile is sent back from a worker process
+       as part of a :py:class:`WriteResult`.
+
+       .. py:attribute:: times
+
+          A dictionary ``phase -> seconds``.
+
+       .. py:attribute:: total
+
+          The time needed for the whole file in seconds.
+    """
+    #@indent 3
+    #@include(Profile)
+    #@(Profile doc)
+
+    def __init__(self):
+        self.times = dict.fromkeys(phases, 0.0)
+        self.total = 0.0
+        #the time of the nested phases for each running phase
+        self._nested = []
+
+    def _enter(self):
+        self._nested.append(0.0)
+
+    def _exit(self, name, elapsed):
+        self.times[name] += elapsed - self._nested.pop()
+        if self._nested:
+            self._nested[-1] += elapsed
+
+    def as_dict(self):
+        return { "times" : self.times, "total" : self.total }
+
+#@(Profile)
+
+#@cstart(profiled)
+@contextmanager
+def profiled(profile):
+    """
+    .. py:function:: profiled(profile)
+
+       A context manager measuring the phases of the current thread in ``profile``.
+
+       :param profile: A :py:class:`Profile` or None, if nothing should be measured.
+    """
+    if profile is None:
+        yield
+        return
+
+    previous = getattr(_local, "profile", None)
+    _local.profile = profile
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.total += time.perf_counter() - start
+        _local.profile = previous
+
+#@(profiled)
+
+#@cstart(phase)
+@contextmanager
+def phase(name):
+#@start(phase doc)
+    """
+.. py:function:: phase(name)
+
+   A context manager measuring a phase of the file the current thread processes.
+   Outside of :py:func:`profiled` nothing is measured.
+
+   :param string name: One of the names in ``phases``.
+    """
+#@include(phase)
+#@(phase doc)
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        yield
+        return
+
+    profile._enter()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile._exit(name, time.perf_counter() - start)
+
+#@(phase)
+
+#@cstart(format_profile)
+def format_profile(results):
+    """
+    .. py:function:: format_profile(results)
+
+       Creates the table of the ``--profile`` option. The files are sorted by their
+       total time, the slowest file first. The last row contains the sum of all files.
+
+       :param results: A list of :py:class:`WriteResult` objects.
+       :return: The table as a string.
+    """
+    profiled_results = [ r for r in results if r.profile is not None ]
+    profiled_results.sort(key=lambda r: r.profile.total, reverse=True)
+
+    rows = [ (os.path.relpath(r.input_file), r.profile) for r in profiled_results ]
+
+    total = Profile()
+    for name, profile in rows:
+        for p in phases:
+            total.times[p] += profile.times[p]
+        total.total += profile.total
+
+    rows.append(("total (%i files)" % len(profiled_results), total))
+
+    width = max(len(name) for name, profile in rows)
+    columns = phases + ("total",)
+    lines = [ "%-*s %s" % (width, "file", " ".join("%10s" % c for c in columns)) ]
+
+    for name, profile in rows:
+        values = [ profile.times[p] for p in phases ] + [profile.total]
+        lines.append("%-*s %s" % (width, name, " ".join("%10.4f" % v for v in values)))
+
+    return "\n".join(lines)
+
+#@(format_profile)
+
+#@cstart(save_profile)
+def save_profile(fname, results):
+    """
+    .. py:function:: save_profile(fname, results)
+
+       Writes the timings of the ``--profile`` option as a json file.
+
+       :param string fname: The path of the json file.
+       :param results: A list of :py:class:`WriteResult` objects.
+    """
+    data = { "phases" : list(phases),
+             "files" : { r.input_file : r.profile.as_dict()
+                         for r in results if r.profile is not None } }
+
+    try:
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+    except (IOError, OSError) as e:
+        logger.warning("Could not write the profile %s: %s", fname, e)
+
+#@(save_profile)
@@ -65,7 +65,7 @@ class CReader(Reader):
                     continue
                 
                 if stext.startswith(self.single_comment_marker):
-                    l.text = l.indented(stext[2:])
+                    l = l.like(stext[2:])
                             
             yield l
 #@edoc
@@ -195,7 +195,7 @@ class CSharpReader(CReader):
                     continue
 
                 if text.startswith("/") and not text.startswith(self.block_comment_marker_start):
-                    l.text = l.indented(text[1:])
+                    l = l.like(text[1:])
 
                     if xml_start_index == self.default_xml_block_index:
                         #indicates that a new xml_block has started
@@ -48,7 +48,7 @@ class ClojureReader(Reader):
 		
                 if stext.startswith(self.single_comment_marker):
                     #remove comments but not chapters
-                    l.text = l.indented(stext[1:])
+                    l = l.like(stext[1:])
 
             yield l
     #@edoc
@@ -0,0 +1,97 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import re
+from pygments.token import Token
+
+#@start()
+"""
+.. _label-comment-scanner:
+
+@include(CommentScanner doc)
+"""
+
+#@cstart(CommentScanner)
+class CommentScanner(object):
+    #@start(CommentScanner doc)
+    #CommentScanner
+    #==============
+    """
+    .. py:class:: CommentScanner(single_comments, block_comments, strings)
+
+       A fast replacement of the pygments lexer for the ``native`` engine (``--engine`` option).
+       The readers only look at comment tokens, so the scanner does not lex the whole
+       source code: it only finds the comments with a single regular expression built
+       from the comment markers of the :py:class:`Language`.
+
+       String literals are skipped, so a comment marker within a string does not start a comment.
+       If the language has string literals, a backslash escapes the following character (also outside
+       of a string literal, e.g. a line continuation). A string literal ends at the end of a line,
+       if its closing delimiter is missing.
+
+       :param list single_comments: The single comment markers (e.g. ``["//"]``).
+       :param list block_comments: The block comment markers: a pair of markers (e.g. ``["/*", "*/"]``)
+                                   or a list of pairs.
+       :param list strings: The string delimiters (e.g. ``['"', "'"]``).
+    """
+    #@indent 3
+    #@include(CommentScanner)
+    #@include(CommentScanner.get_tokens_unprocessed doc)
+    #@(CommentScanner doc)
+
+    def __init__(self, single_comments, block_comments, strings):
+        self.single_comments = single_comments
+        self.block_comments = block_comments
+        self.strings = strings
+
+        if block_comments and isinstance(block_comments[0], str):
+            #a single pair of markers
+            block_comments = [block_comments]
+
+        #the comments are named groups (the names have to be unique), the strings are unnamed
+        expressions = []
+
+        #longer markers first: a marker must not be hidden by its prefix
+        for start, end in sorted(block_comments, key=lambda b: -len(b[0])):
+            expressions.append("(?P<multiline%i>%s.*?%s)"
+                               % (len(expressions), re.escape(start), re.escape(end)))
+
+        for marker in sorted(single_comments, key=lambda m: -len(m)):
+            expressions.append(r"(?P<single%i>%s[^\n]*)" % (len(expressions), re.escape(marker)))
+
+        for delimiter in sorted(strings, key=lambda d: -len(d)):
+            d = re.escape(delimiter)
+            expressions.append(r"%s(?:\\.|(?!%s)[^\\\n])*(?:%s)?" % (d, d, d))
+
+        if strings:
+            expressions.append(r"\\.")
+
+        self._tokens = re.compile("|".join(expressions), re.S)
+
+    #@cstart(CommentScanner.get_tokens_unprocessed)
+    def get_tokens_unprocessed(self, text):
+        """
+        .. py:method:: get_tokens_unprocessed(text)
+
+           Finds the comments of the source code, like the method of a pygments lexer
+           with the same name.
+
+           :param string text: The source code.
+           :return: An iterator of ``(index, token, value)`` tuples. The token is
+                    ``Token.Comment.Single`` or ``Token.Comment.Multiline``.
+        """
+        for mo in self._tokens.finditer(text):
+            kind = mo.lastgroup
+            if kind is None:
+                #a string literal or an escaped character
+                continue
+
+            token = Token.Comment.Single if kind.startswith("single") else Token.Comment.Multiline
+            yield mo.start(), token, mo.group()
+
+    #@(CommentScanner.get_tokens_unprocessed)
+
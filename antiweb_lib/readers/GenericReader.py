@@ -56,6 +56,6 @@ class GenericReader(Reader):
                     continue
 
                 if stext.startswith(self.single_comment_marker):
-                    l.text = l.indented(stext[len(self.single_comment_marker):])
+                    l = l.like(stext[len(self.single_comment_marker):])
                             
             yield l
@@ -6,7 +6,8 @@ __maintainer__ = "antiweb team"
 __email__ = "antiweb@freelists.org"
 
 import sys
-import pygments.lexers as pm
+import importlib
+import threading
 from pygments.util import ClassNotFound
 
 import logging
@@ -27,21 +28,40 @@ class Language(object):
     #Language
     #========
     """
-    .. py:class:: Language(name, reader, single_comments, block_comments)
+    .. py:class:: Language(name, reader, single_comments, block_comments[, strings, scanner])
 
        This class represents a supported language of antiweb.
+       The pygments lexer, the reader class and the supported files are loaded when they
+       are used for the first time. The supported files are taken from pygments' lexer
+       metadata, so no lexer module has to be imported to check a file name.
+
+       The comments of a source file are found by one of two engines:
+
+         * ``pygments`` (default): the pygments lexer of the language.
+         * ``native``: a :py:class:`CommentScanner` built from the comment markers and
+           string delimiters of the language. It is much faster, as only the comments are
+           searched. A language can define its own scanner class instead (e.g. the
+           :py:class:`PythonScanner`). Languages without a scanner class and without a
+           definition of their string delimiters do not support this engine and use pygments.
+
+       The engine is selected for each language by its ``engine`` attribute
+       (see :py:meth:`set_engine`).
     """
 
     #@include(Language)
     #@include(Language.__init__ doc)
+    #@include(Language.supported_files doc)
+    #@include(Language.lexer doc)
+    #@include(Language.scanner doc)
+    #@include(Language.reader doc)
     #@include(Language.get_reader doc)
     #@(Language doc)
 
 
     #@cstart(Language.__init__)
-    def __init__(self, name, reader, single_comments, block_comments):
+    def __init__(self, name, reader, single_comments, block_comments, strings=None, scanner=None):
         """
-        .. py:method:: __init__(name, reader, single_comments, block_comments)
+        .. py:method:: __init__(name, reader, single_comments, block_comments[, strings, scanner])
 
            The constructor.
            The comment markers of a language have to be defined in the format:
@@ -49,28 +69,142 @@ class Language(object):
            Multiple single and block comment markers can be defined.
 
            :param string name: the name of a pygments lexer.
-           :param class reader: the reader class that should be used for the corresponding language.
+           :param reader: the reader class that should be used for the corresponding language,
+                          or its import path as a string (e.g. ``"antiweb_lib.readers.CReader.CReader"``).
            :param list single_comments: a list of single comment characters supported by the language (e.g. ['#']).
            :param list<tuple> block_comments: a list of block comment character tuples supported by the language (e.g. ["/*","*/"]).
+           :param list strings: a list of string delimiters of the language (e.g. ['"']) used by the ``native`` engine,
+                                an empty list if the language has no strings and None if the ``native``
+                                engine is not supported.
+           :param scanner: the scanner class of the ``native`` engine or its import path as a string.
+                           It is created with the comment markers and the string delimiters.
+                           The default is :py:class:`CommentScanner`.
         """
-        try:
-            self.lexer = pm.get_lexer_by_name(name)
-        except ClassNotFound:
-            logger.error("\nError: No lexer for alias: '%s' found", name)
-            sys.exit(1)
-
-        self.reader = reader
+        self.name = name
+        self.strings = strings
+        #the engine finding the comments: "pygments" or "native"
+        self.engine = "pygments"
+        self._scanner_class = scanner
+        self._scanner = None
+        #the reused reader of each thread
+        self._readers = threading.local()
+        self._lexer = None
+        self._reader = reader
+        self._supported_files = None
         self.single_comments = single_comments
         self.block_comments = block_comments
 
-        #the lexer filenames have the format: ['*.cs', '*.cpp', ..]
-        self.supported_files = self.lexer.filenames
+    #@cstart(Language.supported_files)
+    @property
+    def supported_files(self):
+        """
+        .. py:attribute:: supported_files
+
+           The file name patterns of the lexer in the format: ['*.cs', '*.cpp', ..]
+        """
+        if self._supported_files is None:
+            self._supported_files = _lexer_filenames(self.name)
+
+        if self._supported_files is None:
+            #the lexer is not in pygments' metadata (e.g. a plugin): load it
+            self._supported_files = list(self.lexer.filenames)
+
+        return self._supported_files
+
+    #@cstart(Language.lexer)
+    @property
+    def lexer(self):
+        """
+        .. py:attribute:: lexer
+
+           The pygments lexer of the language. It is created on first access.
+        """
+        if self._lexer is None:
+            import pygments.lexers as pm
+
+            try:
+                self._lexer = pm.get_lexer_by_name(self.name)
+            except ClassNotFound:
+                logger.error("\nError: No lexer for alias: '%s' found", self.name)
+                sys.exit(1)
+
+        return self._lexer
+
+    #@cstart(Language.scanner)
+    @property
+    def scanner(self):
+        """
+        .. py:attribute:: scanner
+
+           The scanner of the ``native`` engine, or None if the language does not
+           support the ``native`` engine. It is created on first access.
+        """
+        if self._scanner is None and (self._scanner_class or self.strings is not None):
+            scanner_class = self._scanner_class or "antiweb_lib.readers.CommentScanner.CommentScanner"
+            if isinstance(scanner_class, str):
+                module_name, class_name = scanner_class.rsplit(".", 1)
+                scanner_class = getattr(importlib.import_module(module_name), class_name)
+
+            self._scanner = scanner_class(self.single_comments, self.block_comments, self.strings)
+
+        return self._scanner
+
+    #@cstart(Language.reader)
+    @property
+    def reader(self):
+        """
+        .. py:attribute:: reader
+
+           The reader class of the language. A reader given as import path
+           is imported on first access.
+        """
+        if isinstance(self._reader, str):
+            module_name, class_name = self._reader.rsplit(".", 1)
+            self._reader = getattr(importlib.import_module(module_name), class_name)
+
+        return self._reader
 
     #@cstart(Language.get_reader)
     def get_reader(self):
         """
         .. py:method:: get_reader()
 
-           returns a new instance of the :py:attr:`reader` class.
+           returns an instance of the :py:attr:`reader` class. The reader gets the
+           :py:attr:`scanner` instead of the pygments lexer, if the ``native`` engine is selected.
+
+           The readers are reused: each thread gets the same reader for every file of the
+           language, as long as the engine is not changed. A reader clears its state at the
+           beginning of :py:meth:`Reader.process`, so it can be used for a sub document while
+           the document of the including file is still processed.
         """
-        return self.reader(self.lexer, self.single_comments, self.block_comments)
\ No newline at end of file
+        lexer = self.scanner if self.engine == "native" else None
+        if lexer is None:
+            lexer = self.lexer
+
+        reader = getattr(self._readers, "reader", None)
+        if reader is None or reader.lexer is not lexer:
+            reader = self.reader(lexer, self.single_comments, self.block_comments)
+            self._readers.reader = reader
+
+        return reader
+
+    #@(Language.get_reader)
+
+
+def _lexer_filenames(name):
+    #the static lexer metadata of pygments: (name, aliases, filenames, mimetypes)
+    try:
+        #the mapping of the builtin lexers is much faster than get_all_lexers, which also loads the plugins
+        from pygments.lexers._mapping import LEXERS
+        metadata = (l[1:] for l in LEXERS.values())
+    except ImportError:
+        from pygments.lexers import get_all_lexers
+        metadata = get_all_lexers()
+
+    #the same lookup as pygments.lexers.get_lexer_by_name
+    alias = name.lower()
+    for lexer_name, aliases, filenames, mimetypes in metadata:
+        if alias in aliases:
+            return list(filenames)
+
+    return None
@@ -33,41 +33,50 @@ class Line(object):
     #@include(Line.like doc)
     #@include(Line.indented doc)
     #@include(Line.change_indent doc)
+    #@include(Line.modified doc)
     #@include(Line.__len__ doc)
     #@include(Line.__repr__ doc)
     #@(Line doc)
+
+    #a line object is created for every source line: no instance dictionaries
+    __slots__ = ("fname", "index", "type", "_directives", "_text", "_indent", "_length")
+
     #Attributes
-    #@cstart(Line._directives)
-    _directives = ()
+    #@start(Line._directives doc)
     """
     .. py:attribute:: _directives
     
        A list of :py:class:`Directive` objects, sorted
        by their priority.
+
     """
-    #@cstart(Line.fname)
-    fname = ""
+    #@(Line._directives doc)
+    #@start(Line.fname doc)
     """
     .. py:attribute:: fname
     
        A string of the source's file name the line belongs to.
+
     """
-    #@cstart(Line.index)
-    index = 0
+    #@(Line.fname doc)
+    #@start(Line.index doc)
     """
     .. py:attribute:: index
     
        The integer line index of the directive within the current block.
+
     """
-    #@cstart(Line.text)
-    text = ""
+    #@(Line.index doc)
+    #@start(Line.text doc)
     """
     .. py:attribute:: text
     
-       A string containing the source line.
+       A string containing the source line. The indentation and
+       the length of the stripped text are computed, when the text is set.
+
     """
-    #@cstart(Line.type)
-    type = "d"
+    #@(Line.text doc)
+    #@start(Line.type doc)
     """
     .. py:attribute:: type
     
@@ -75,7 +84,9 @@ class Line(object):
 
          * ``d`` stands for a document line
          * ``c`` stands for a code line
+
     """
+    #@(Line.type doc)
     #@
 
     #Methods
@@ -155,15 +166,56 @@ class Line(object):
 
            Changes the lines indentation.
         """
+        #only whitespace is added or removed: the stripped length does not change
         if delta < 0:
-            delta = min(-delta, self.indent)
-            self.text = self.text[delta:]
+            delta = min(-delta, self._indent)
+            self._text = self._text[delta:]
+            self._indent -= delta
 
         elif delta > 0:
-            self.text = " "*delta + self.text
+            self._text = " "*delta + self._text
+            self._indent += delta
 
         return self
 
+    #@cstart(Line.modified)
+    def modified(self, delta=0, text=None, index=None, type=None, directives=None):
+        """
+        .. py:method:: modified([delta=0[, text=None[, index=None[, type=None[, directives=None]]]]])
+
+           The copy-on-write version of :py:meth:`change_indent` and :py:meth:`set`.
+           The blocks of a document share their line objects, a line must not be
+           changed in place when it is processed. A copy is made only if the
+           line really changes.
+
+           :param integer delta: The change of the indentation.
+           :param string text: A new text.
+           :param integer index: A new line index.
+           :param char type: Either ``'d'`` or ``'c'``.
+           :param list directives: A new list of :py:class:`Directive` objects.
+           :return: ``self`` if nothing changes, otherwise a changed copy.
+        """
+        if (text is None and directives is None
+            and (delta == 0 or (delta < 0 and not self._indent))
+            and (index is None or index == self.index)
+            and (type is None or type == self.type)):
+            return self
+
+        #the directive list is never changed in place: the copy may share it
+        line = Line.__new__(Line)
+        line.fname = self.fname
+        line.index = self.index
+        line.type = self.type
+        line._directives = self._directives
+        line._text = self._text
+        line._indent = self._indent
+        line._length = self._length
+
+        if text is not None:
+            line.text = text
+
+        return line.change_indent(delta).set(index, type, directives)
+
     #@cstart(Line.__len__)
     def __len__(self):
         """
@@ -171,7 +223,7 @@ class Line(object):
 
            returns the length of the stripped :py:attr:`text`.
         """
-        return len(self.text.strip())
+        return self._length
         
 
     #@cstart(Line.__repr__)
@@ -193,7 +245,7 @@ class Line(object):
 
         An integer representing the line's indentation.
         """
-        return len(self.text)-len(self.text.lstrip())
+        return self._indent
 
 
     #@cstart(Line.sindent)
@@ -204,7 +256,20 @@ class Line(object):
 
         A string representation of the line's indentation.
         """
-        return " "*self.indent
+        return " "*self._indent
+
+
+    @property
+    def text(self):
+        return self._text
+
+
+    @text.setter
+    def text(self, value):
+        stripped = value.lstrip()
+        self._text = value
+        self._indent = len(value) - len(stripped)
+        self._length = len(stripped.rstrip())
 
 
     #@cstart(Line.directives)
@@ -69,6 +69,7 @@ class PythonReader(Reader):
 
     #@indent 3
     #@include(PythonReader)
+    #@include(PythonReader.reset doc)
     #@include(PythonReader._post_process doc)
     #@include(PythonReader._accept_token doc)
     #@include(PythonReader.filter_output doc)
@@ -80,6 +81,16 @@ class PythonReader(Reader):
         self.single_comment_marker = single_comment_markers[0]
         self.doc_string_marker = '"""'
 
+    #@cstart(PythonReader.reset)
+    def reset(self):
+        """
+        .. py:method:: reset()
+
+           See :py:meth:`Reader.reset`.
+        """
+        super(PythonReader, self).reset()
+        self.doc_lines = []
+
     #@cstart(PythonReader._post_process)
     def _post_process(self, fname, text):
         """
@@ -212,6 +223,6 @@ class PythonReader(Reader):
 
                 if stext.startswith(self.single_comment_marker):
                     #remove comments but not chapters
-                    l.text = l.indented(stext[1:])
+                    l = l.like(stext[1:])
 
             yield l
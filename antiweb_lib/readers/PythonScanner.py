@@ -0,0 +1,96 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import io
+import re
+import tokenize
+from pygments.token import Token
+
+#@start()
+"""
+.. _label-python-scanner:
+
+@include(PythonScanner doc)
+"""
+
+#@cstart(PythonScanner)
+class PythonScanner(object):
+    #@start(PythonScanner doc)
+    #PythonScanner
+    #=============
+    """
+    .. py:class:: PythonScanner(single_comments, block_comments, strings)
+
+       The scanner of the ``native`` engine for Python (see :py:class:`CommentScanner`).
+       The comments and doc strings are found by the ``tokenize`` module of the standard
+       library, which is several times faster than the pygments lexer. The arguments
+       are the same as for :py:class:`CommentScanner`, they are not needed by ``tokenize``.
+
+       Like the pygments lexer, a triple quoted string is a doc string if only white space
+       precedes it in its line. The string may have a prefix of at most two of the
+       characters ``rRuUbB``.
+
+       ``tokenize`` rejects some sources the pygments lexer accepts (e.g. an unterminated
+       string or a wrong indentation). Such a source is lexed by pygments.
+    """
+    #@indent 3
+    #@include(PythonScanner)
+    #@include(PythonScanner.get_tokens_unprocessed doc)
+    #@(PythonScanner doc)
+
+    doc_string = re.compile(r"([rRuUbB]{,2})('''|\"\"\")")
+
+    def __init__(self, single_comments, block_comments, strings):
+        self.single_comments = single_comments
+        self.block_comments = block_comments
+        self.strings = strings
+        self._fallback = None
+
+    #@cstart(PythonScanner.get_tokens_unprocessed)
+    def get_tokens_unprocessed(self, text):
+        """
+        .. py:method:: get_tokens_unprocessed(text)
+
+           Finds the comments and doc strings of the source code, like the method of a
+           pygments lexer with the same name.
+
+           :param string text: The source code.
+           :return: An iterator of ``(index, token, value)`` tuples. The token is
+                    ``Token.Comment.Single`` or ``Token.Literal.String.Doc``.
+        """
+        try:
+            return iter(self._tokenize(text))
+        except (tokenize.TokenError, SyntaxError):
+            return self._get_fallback().get_tokens_unprocessed(text)
+
+    #@(PythonScanner.get_tokens_unprocessed)
+
+    def _tokenize(self, text):
+        #the start index of each line: tokenize returns (row, column) positions
+        starts = [0]
+        starts.extend(mo.end() for mo in re.finditer("\n", text))
+
+        tokens = []
+        for kind, value, (row, column), end, line in tokenize.generate_tokens(io.StringIO(text).readline):
+            if kind == tokenize.COMMENT:
+                tokens.append((starts[row-1] + column, Token.Comment.Single, value))
+
+            elif kind == tokenize.STRING and not line[:column].strip():
+                mo = self.doc_string.match(value)
+                if mo:
+                    #the value of the doc string token does not contain the prefix
+                    index = starts[row-1] + column + mo.end(1)
+                    tokens.append((index, Token.Literal.String.Doc, value[mo.end(1):]))
+
+        return tokens
+
+    def _get_fallback(self):
+        if self._fallback is None:
+            import pygments.lexers as pm
+            self._fallback = pm.get_lexer_by_name("Python")
+
+        return self._fallback
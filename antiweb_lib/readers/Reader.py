@@ -10,6 +10,7 @@ import bisect
 
 from antiweb_lib.directives import *
 from antiweb_lib.readers.Line import Line
+from antiweb_lib.profiling import phase
 
 #@start()
 """
@@ -67,6 +68,7 @@ class Reader(object):
     #@include(Reader)
     #@include(Reader.__init__ doc)
     #@include(Reader.process doc)
+    #@include(Reader.reset doc)
     #@include(Reader.filter_output doc)
     #@include(Reader._handle_token doc)
     #@include(Reader._cut_comment doc)
@@ -81,7 +83,7 @@ class Reader(object):
 
            The constructor initialises the language specific pygments lexer and comment markers.
 
-           :param Lexer lexer: The language specific pygments lexer.
+           :param Lexer lexer: The language specific pygments lexer or a :py:class:`CommentScanner`.
            :param string[] single_comment_markers: The language specific single comment markers.
            :param string[] block_comment_markers: The language specific block comment markers.
         """
@@ -95,12 +97,15 @@ class Reader(object):
         .. py:method:: process(fname, text)
 
            Reads the source code and identifies the directives.
-           This method is call by :py:class:`Document`.
+           This method is call by :py:class:`Document`. A reader can process
+           several files, the state of the previous file is cleared (see :py:meth:`reset`).
 
            :param string fname: The file name of the source code
            :param string text: The source code
            :return: A list of :py:class:`Line` objects.
         """
+        self.reset()
+
         text = text.replace("\t", " "*8)
         starts = [ mo.start() for mo in re_line_start.finditer(text) ]
         lines = [ Line(fname, i, l) for i, l in enumerate(text.splitlines()) ]
@@ -108,11 +113,29 @@ class Reader(object):
         self.lines = lines    # A list of lines
         self.starts = starts  # the start indices of the lines
 
-        tokens = self.lexer.get_tokens_unprocessed(text)
-        for index, token, value in tokens:
-            self._handle_token(index, token, value)
-        self._post_process(fname, text)
-        return self.lines
+        with phase("lex"):
+            tokens = self.lexer.get_tokens_unprocessed(text)
+            for index, token, value in tokens:
+                self._handle_token(index, token, value)
+
+        with phase("directives"):
+            self._post_process(fname, text)
+
+        #do not keep the lines of the file alive
+        lines = self.lines
+        self.reset()
+        return lines
+
+    #@cstart(Reader.reset)
+    def reset(self):
+        """
+        .. py:method:: reset()
+
+           Clears the state of the processed file. Subclasses with their own state
+           have to extend this method.
+        """
+        self.lines = []
+        self.starts = []
 
 
     #@cstart(Reader.filter_output)
@@ -162,6 +185,9 @@ class Reader(object):
             for d in l.directives:
                 d.match(self.lines)
 
+        #match the start and end directives
+        find_block_ends(self.lines)
+
 
     #@cstart(Reader._handle_token)
     def _handle_token(self, index, token, value):
@@ -177,12 +203,19 @@ class Reader(object):
 
         if not self._accept_token(token): return
         cvalue = self._cut_comment(index, token, value)
+        found = scanner.scan(cvalue)
+        if not found: return
+
         offset = value.index(cvalue)
-        for k, v in list(directives.items()):
-            for mo in v.expression.finditer(cvalue):
-                li = bisect.bisect(self.starts, index+mo.start()+offset)-1
-                line = self.lines[li]
-                line.directives = list(line.directives) + [ v(line.index, mo) ]
+        new_directives = {}
+        for v, mo in found:
+            li = bisect.bisect(self.starts, index+mo.start()+offset)-1
+            line = self.lines[li]
+            new_directives.setdefault(li, []).append(v(line.index, mo))
+
+        for li, line_directives in new_directives.items():
+            line = self.lines[li]
+            line.directives = list(line.directives) + line_directives
 
 
     #@cstart(Reader._cut_comment)
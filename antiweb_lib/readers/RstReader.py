@@ -55,6 +55,6 @@ class RstReader(Reader):
                 
                 if stext.startswith(self.single_comment_marker):
                     #remove comments but not chapters
-                    l.text = l.indented(stext[3:])
+                    l = l.like(stext[3:])
                             
             yield l
@@ -87,11 +87,11 @@ class XmlReader(Reader):
                 #the block comment markers should be removed for cases like: '<!-- asdasdasd -->'
                 if stext.startswith(self.block_comment_marker_start):
                     stext = self.remove_block_comment_start(stext)
-                    l.text = stext.strip()
+                    l = l.modified(text=stext.strip())
 
                 if stext.endswith(self.block_comment_marker_end):
                     stext = self.remove_block_comment_end(stext)
-                    l.text = stext.strip()
+                    l = l.modified(text=stext.strip())
 
             yield l
 
@@ -5,33 +5,31 @@ __version__ = "0.9.1"
 __maintainer__ = "antiweb team"
 __email__ = "antiweb@freelists.org"
 
-from antiweb_lib.readers.CReader import CReader
-from antiweb_lib.readers.CSharpReader import CSharpReader
-from antiweb_lib.readers.ClojureReader import ClojureReader
-from antiweb_lib.readers.RstReader import RstReader
-from antiweb_lib.readers.PythonReader import PythonReader
-from antiweb_lib.readers.XmlReader import XmlReader
+import os
+import re
+from fnmatch import translate
+from collections.abc import Sequence
+
 from antiweb_lib.readers.Language import Language
-from fnmatch import fnmatch
 
 
 #@start(supported_languages doc)
 
-#The following list contains all supported languages:
+#The following list contains all supported languages.
+#The readers are given by their import path, they are imported when a file of the language is processed.
+#The last arguments are the string delimiters or the scanner class of the native engine (see :ref:`Language <label-language>`):
 
 #@code
 supported_languages =[
-    Language("C", CReader, ["//"],(["/*","*/"])),
-    Language("C++", CReader, ["//"],(["/*","*/"])),
-    Language("C#", CSharpReader, ["//"],(["/*","*/"])),
-    Language("Python", PythonReader, ["#"],(["'''","'''"],["\"\"\"","\"\"\""])),
-    Language("Clojure", ClojureReader, [";"], []),
-    Language("reStructuredText", RstReader, [".. "],[]),
-    Language("XML", XmlReader, [], (["<!--","-->"]))
+    Language("C", "antiweb_lib.readers.CReader.CReader", ["//"],(["/*","*/"]), ['"', "'"]),
+    Language("C++", "antiweb_lib.readers.CReader.CReader", ["//"],(["/*","*/"]), ['"', "'"]),
+    Language("C#", "antiweb_lib.readers.CSharpReader.CSharpReader", ["//"],(["/*","*/"]), ['"', "'"]),
+    Language("Python", "antiweb_lib.readers.PythonReader.PythonReader", ["#"],(["'''","'''"],["\"\"\"","\"\"\""]),
+             scanner="antiweb_lib.readers.PythonScanner.PythonScanner"),
+    Language("Clojure", "antiweb_lib.readers.ClojureReader.ClojureReader", [";"], [], ['"']),
+    Language("reStructuredText", "antiweb_lib.readers.RstReader.RstReader", [".. "],[]),
+    Language("XML", "antiweb_lib.readers.XmlReader.XmlReader", [], (["<!--","-->"]), [])
 ]
-
-#sum(list, []) is used to flatten the list as the supported_files of a language are also lists
-supported_files = sum([language.supported_files for language in supported_languages], [])
 #@edoc
 
 #@(supported_languages doc)
@@ -59,11 +57,165 @@ Recommended steps when adding a new language:
 
 #@(new_language doc)
 
+#@start(file index doc)
+'''
+The language of a file is found by the file name patterns of the languages (``fnmatch`` patterns).
+The first language with a matching pattern is used. To avoid matching every pattern for each file,
+the patterns are indexed, when a file is checked for the first time:
+
+  * simple extension patterns (``*.ext``) are stored in a dictionary,
+  * exact file names (e.g. ``SConstruct``) are stored in a dictionary,
+  * only the remaining patterns (e.g. ``*.x[bp]m``) are matched with a regular expression.
+
+The index is rebuilt if the list of supported_languages was changed.
+'''
+#@(file index doc)
+
+#@cstart(get_language_for_file)
+def get_language_for_file(file):
+    """
+.. py:method:: get_language_for_file(file)
+
+   :param string file: The path of a file.
+   :return: The :py:class:`Language` of the file, or None if the file is not supported.
+    """
+    languages, suffixes, names, patterns = _get_index()
+    not_found = len(languages)
+
+    #like fnmatch: the case is normalized on case insensitive file systems
+    name = os.path.normcase(file)
+    best = names.get(name, not_found)
+
+    #all suffixes of the base name beginning with a dot
+    pos = name.find(".", max(name.rfind("/"), name.rfind(os.sep)) + 1)
+    while pos >= 0:
+        best = min(best, suffixes.get(name[pos:], not_found))
+        pos = name.find(".", pos + 1)
+
+    #the patterns are sorted by the language order
+    for rank, match in patterns:
+        if rank >= best:
+            break
+
+        if match(name):
+            best = rank
+
+    return languages[best] if best < not_found else None
+
+#@(get_language_for_file)
+
+_index = None
+
+def _get_index():
+    global _index
+
+    languages = tuple(supported_languages)
+    if _index is None or _index[0] != languages:
+        _index = (languages,) + _build_index(languages)
+
+    return _index
+
+def _build_index(languages):
+    #file suffix -> language index
+    suffixes = {}
+    #file name -> language index
+    names = {}
+    #(language index, match function of a pattern)
+    patterns = []
+
+    for rank, language in enumerate(languages):
+        for pattern in language.supported_files:
+            pattern = os.path.normcase(pattern)
+            suffix = pattern[1:]
+
+            if pattern.startswith("*.") and not _has_magic(suffix) and not _has_separator(suffix):
+                suffixes.setdefault(suffix, rank)
+            elif not _has_magic(pattern):
+                names.setdefault(pattern, rank)
+            else:
+                patterns.append((rank, re.compile(translate(pattern)).match))
+
+    return suffixes, names, patterns
+
+def _has_magic(pattern):
+    return any(c in pattern for c in "*?[")
+
+def _has_separator(pattern):
+    return "/" in pattern or os.sep in pattern
+
+def get_supported_files():
+    #sum(list, []) is used to flatten the list as the supported_files of a language are also lists
+    return sum([language.supported_files for language in supported_languages], [])
+
+class _SupportedFiles(Sequence):
+    #the patterns of all languages, computed on access: they are loaded from pygments
+    def __getitem__(self, index):
+        return get_supported_files()[index]
+
+    def __len__(self):
+        return len(get_supported_files())
+
+    def __iter__(self):
+        return iter(get_supported_files())
+
+    def __contains__(self, pattern):
+        return pattern in get_supported_files()
+
+    def __eq__(self, other):
+        return get_supported_files() == other
+
+    def __repr__(self):
+        return repr(get_supported_files())
+
+supported_files = _SupportedFiles()
+
+#@cstart(set_engine)
+engines = ("pygments", "native")
+
+def set_engine(engine, name=None):
+    """
+.. py:method:: set_engine(engine[, name])
+
+   Selects the engine finding the comments (see :ref:`Language <label-language>`).
+
+   :param string engine: ``"pygments"`` or ``"native"``.
+   :param string name: The name of a language. If it is None, the engine is selected for all languages.
+   :return: ``False`` if there is no language with the given name. ``True`` otherwise.
+    """
+    found = False
+    for language in supported_languages:
+        if name is None or language.name.lower() == name.lower():
+            language.engine = engine
+            found = True
+
+    return found
+
+def set_engines(selection):
+    """
+.. py:method:: set_engines(selection)
+
+   Selects the engines of the ``--engine`` option. A later value overrides an earlier one,
+   e.g. ``["native", "Python=pygments"]`` selects the native engine for all languages except Python.
+
+   :param list selection: A list of values in the format ``ENGINE`` or ``LANGUAGE=ENGINE``.
+   :raises ValueError: If an engine or a language is unknown.
+    """
+    set_engine(engines[0])
+
+    for value in selection:
+        name, sep, engine = value.rpartition("=")
+        if engine not in engines:
+            raise ValueError("unknown engine: %s (choose from %s)" % (engine, ", ".join(engines)))
+
+        if not set_engine(engine, name or None):
+            raise ValueError("unknown language: %s" % name)
+
+#@(set_engine)
+
 def is_file_supported(file):
-    return any(fnmatch(file, supported_file) for supported_file in supported_files)
+    return get_language_for_file(file) is not None
 
 def get_reader_for_file(file):
-    for language in supported_languages:
-        for supported_file in language.supported_files:
-            if fnmatch(file, supported_file):
-                return language.get_reader()
\ No newline at end of file
+    language = get_language_for_file(file)
+    if language is not None:
+        return language.get_reader()
@@ -0,0 +1,124 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import logging
+from antiweb_lib.fileutil import write_json
+
+logger = logging.getLogger('antiweb')
+
+#@start()
+"""
+.. _label-report:
+
+##########
+Run Report
+##########
+
+The ``--report FILE`` option writes a json report of the run. It contains an entry
+for each processed input file:
+
+  ================ ===============================================================
+  Key              Value
+  ================ ===============================================================
+  ``input``        The absolute path of the input file.
+  ``status``       ``generated``, ``unchanged`` (the output file already contained
+                   the documentation) or ``failed``.
+  ``output``       The absolute path of the output file or null.
+  ``duration``     The processing time in seconds.
+  ``input_lines``  The number of lines of the input file.
+  ``output_lines`` The number of lines of the documentation.
+  ``cache_hit``    True if the output was taken from the build cache.
+  ``errors``       A list of ``{"file", "line", "text"}`` objects.
+  ``warnings``     A list of warning texts (e.g. text blocks that were not included).
+  ``profile``      The timings of the ``--profile`` option, if given.
+  ================ ===============================================================
+
+The ``summary`` counts the files of each status and sums up the lines and durations.
+In daemon mode the report is written after the first run and again when the daemon
+exits, then it also contains an entry for each file the daemon generated.
+Together with ``--quiet`` there is no output for each file at all.
+
+#@include(create_report doc)
+
+#@include(save_report doc)
+"""
+
+#@cstart(create_report)
+def create_report(results, duration, skipped_files=0):
+#@start(create_report doc)
+    """
+.. py:function:: create_report(results, duration[, skipped_files])
+
+   Creates the data of the run report.
+
+   :param results: A list of :py:class:`WriteResult` objects.
+   :param float duration: The duration of the whole run in seconds.
+   :param integer skipped_files: The number of files skipped, because they had no main text block.
+   :return: A dictionary, that can be written as json.
+    """
+#@include(create_report)
+#@(create_report doc)
+    files = [ _result_entry(r) for r in results ]
+
+    summary = { "files" : len(files),
+                "skipped" : skipped_files,
+                "duration" : duration,
+                "cache_hits" : sum(1 for f in files if f["cache_hit"]),
+                "input_lines" : sum(f["input_lines"] for f in files),
+                "output_lines" : sum(f["output_lines"] for f in files) }
+
+    for status in ("generated", "unchanged", "failed"):
+        summary[status] = sum(1 for f in files if f["status"] == status)
+
+    summary["lines_per_second"] = summary["input_lines"] / duration if duration > 0 else 0.0
+
+    return { "version" : __version__, "summary" : summary, "files" : files }
+
+def result_status(result):
+    if not result.out_file:
+        return "failed"
+    if result.unchanged:
+        return "unchanged"
+    return "generated"
+
+def _result_entry(result):
+    entry = { "input" : result.input_file,
+              "status" : result_status(result),
+              "output" : result.out_file,
+              "duration" : result.duration,
+              "input_lines" : result.input_lines,
+              "output_lines" : result.output_lines,
+              "cache_hit" : result.cache_hit,
+              "errors" : [ { "file" : l.fname, "line" : l.index + 1, "text" : text }
+                           for l, text in result.error_list ],
+              "warnings" : list(result.warnings) }
+
+    if result.profile is not None:
+        entry["profile"] = result.profile.as_dict()
+
+    return entry
+#@(create_report)
+
+#@cstart(save_report)
+def save_report(fname, report):
+#@start(save_report doc)
+    """
+.. py:function:: save_report(fname, report)
+
+   Writes the report as a json file. The file is replaced at once, so a dashboard
+   reading the report never sees a partial file.
+
+   :param string fname: The path of the report file.
+   :param report: The data created by :py:func:`create_report`.
+    """
+#@include(save_report)
+#@(save_report doc)
+    try:
+        write_json(fname, report, indent=1, sort_keys=True)
+    except (IOError, OSError) as e:
+        logger.warning("Could not write %s: %s", fname, e)
+#@(save_report)
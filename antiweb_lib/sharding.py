@@ -0,0 +1,254 @@
+__author__ = "Michael Reithinger, Philipp Rathmanner, Lukas Tanner, Philipp Grandits, and Christian Eitner"
+__copyright__ = "Copyright 2017, antiweb team"
+__license__ = "GPL"
+__version__ = "0.9.1"
+__maintainer__ = "antiweb team"
+__email__ = "antiweb@freelists.org"
+
+import os
+import re
+import json
+import zlib
+import logging
+
+from antiweb_lib.write import get_out_file
+from antiweb_lib.report import result_status, save_report
+
+logger = logging.getLogger('antiweb')
+
+#@start()
+"""
+.. _label-sharding:
+
+########
+Sharding
+########
+
+With the ``--shard INDEX/COUNT`` option (e.g. ``--shard 2/4``) the ``-r`` option only processes
+a part of the files, so the documentation of a large directory can be generated by several
+machines. ``INDEX`` counts from 1 to ``COUNT``. Each machine walks the whole directory and gets
+the same partition: a file belongs to the shard given by the crc32 hash of its path relative to
+the directory.
+
+Files which depend on each other are kept in the same shard:
+
+  * An rst file which might be the output of another source (``file.rst`` of ``file.py``)
+    is only processed if that source could not be written.
+  * Files writing the same output file (e.g. ``a/file.py`` and ``b/file.py`` with ``-o``):
+    the last one wins.
+
+Therefore the files are grouped by their output files first and the group is hashed
+(see :py:func:`select_shard`).
+
+Each shard writes a manifest ``antiweb_shard_INDEX_of_COUNT.json`` into the output directory.
+It lists the status and the output file of each source of the shard. After the output
+directories of all shards were merged, ``antiweb.py --check-shards DIRECTORY`` checks that the
+manifests of all shards are there, that every source belongs to exactly one shard, that no file
+failed and that all outputs exist (see :py:func:`check_manifests`). With the ``--incremental``
+option each shard saves its own dependency graph.
+
+#@include(parse_shard doc)
+
+#@include(select_shard doc)
+
+#@include(create_manifest doc)
+
+#@include(check_manifests doc)
+"""
+
+#@cstart(parse_shard)
+_re_shard = re.compile(r"^\s*(\d+)\s*/\s*(\d+)\s*$")
+_re_manifest = re.compile(r"^antiweb_shard_(\d+)_of_(\d+)\.json$")
+
+def parse_shard(text):
+#@start(parse_shard doc)
+    """
+.. py:function:: parse_shard(text)
+
+   Parses the value of the ``--shard`` option.
+
+   :param string text: ``INDEX/COUNT``, e.g. ``"2/4"``.
+   :return: The tuple ``(index, count)``.
+   :raises ValueError: If the text is not a valid shard.
+    """
+#@include(parse_shard)
+#@(parse_shard doc)
+    match = _re_shard.match(text)
+    if not match:
+        raise ValueError("the shard must be given as INDEX/COUNT: %s" % text)
+
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError("the shard index must be between 1 and %i: %s" % (count, text))
+
+    return index, count
+#@(parse_shard)
+
+def manifest_name(index, count):
+    return "antiweb_shard_%i_of_%i.json" % (index, count)
+
+def _relative(directory, fname):
+    #the keys must be equal on each machine
+    return os.path.relpath(fname, directory).replace(os.sep, "/")
+
+#@cstart(select_shard)
+def select_shard(directory, files, options, index, count):
+#@start(select_shard doc)
+    """
+.. py:function:: select_shard(directory, files, options, index, count)
+
+   Selects the files of a shard. A source and its output file are connected, the
+   connected files form a group. The hash of the smallest relative source path of a
+   group decides the shard of all files of the group.
+
+   :param string directory: The absolute path of the processed directory.
+   :param list files: The absolute paths of all supported files of the directory.
+   :param options: Commandline options.
+   :param integer index: The index of the shard (1 to ``count``).
+   :param integer count: The number of shards.
+   :return: The files of the shard in the order of ``files``.
+    """
+#@include(select_shard)
+#@(select_shard doc)
+    parent = {}
+
+    def find(fname):
+        parent.setdefault(fname, fname)
+        while parent[fname] != fname:
+            parent[fname] = parent[parent[fname]]
+            fname = parent[fname]
+        return fname
+
+    for fname in files:
+        group, output_group = find(fname), find(get_out_file(directory, fname, options))
+        if group != output_group:
+            parent[group] = output_group
+
+    keys = {}
+    for fname in files:
+        group = find(fname)
+        key = _relative(directory, fname)
+        keys[group] = min(keys.get(group, key), key)
+
+    return [ f for f in files
+             if zlib.crc32(keys[find(f)].encode("utf-8")) % count == index - 1 ]
+#@(select_shard)
+
+#@cstart(create_manifest)
+def create_manifest(shard, settings, total_files, directory, output_dir, files,
+                    results, skipped_files, up_to_date):
+#@start(create_manifest doc)
+    """
+.. py:function:: create_manifest(shard, settings, total_files, directory, output_dir, files, results, skipped_files, up_to_date)
+
+   Creates the manifest of a shard. The status of a source is the status of its
+   :py:class:`WriteResult` (see :ref:`Run Report <label-report>`), ``skipped`` for a file
+   without a main text block, ``up to date`` for a file not regenerated by the
+   ``--incremental`` option or ``created`` for an rst file created by another source.
+
+   :param tuple shard: The ``(index, count)`` of the shard.
+   :param dict settings: The settings of the dependency graph.
+   :param integer total_files: The number of supported files of all shards.
+   :param string directory: The absolute path of the processed directory.
+   :param string output_dir: The absolute path of the output directory.
+   :param list files: The supported files of the shard.
+   :param list results: The :py:class:`WriteResult` objects of the shard.
+   :param set skipped_files: The files without a main text block.
+   :param dict up_to_date: The output files of the up to date sources.
+   :return: A dictionary, that can be written as json.
+    """
+#@include(create_manifest)
+#@(create_manifest doc)
+    results = { r.input_file : r for r in results }
+    sources = {}
+
+    for fname in files:
+        result = results.get(fname)
+        if result:
+            status, output = result_status(result), result.out_file
+        elif fname in skipped_files:
+            status, output = "skipped", None
+        elif fname in up_to_date:
+            status, output = "up to date", up_to_date[fname]
+        else:
+            status, output = "created", None
+
+        if output:
+            output = _relative(output_dir, output)
+
+        sources[_relative(directory, fname)] = { "status" : status, "output" : output }
+
+    #the output path may differ between the machines
+    settings = { k : v for k, v in settings.items() if k != "output" }
+
+    return { "shard" : list(shard),
+             "settings" : settings,
+             "files" : total_files,
+             "sources" : sources }
+#@(create_manifest)
+
+def save_manifest(output_dir, manifest):
+    index, count = manifest["shard"]
+    save_report(os.path.join(output_dir, manifest_name(index, count)), manifest)
+
+#@cstart(check_manifests)
+def check_manifests(directory):
+#@start(check_manifests doc)
+    """
+.. py:function:: check_manifests(directory)
+
+   Checks the merged output of all shards.
+
+   :param string directory: The directory containing the manifests and the output files.
+   :return: The tuple ``(problems, files)``: a list of the found problems and
+            the number of sources in the manifests.
+    """
+#@include(check_manifests)
+#@(check_manifests doc)
+    manifests = []
+    for name in sorted(os.listdir(directory)):
+        if _re_manifest.match(name):
+            try:
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    manifests.append((name, json.load(f)))
+            except (IOError, ValueError) as e:
+                return ["cannot read the manifest %s: %s" % (name, e)], 0
+
+    if not manifests:
+        return ["no shard manifests found in %s" % directory], 0
+
+    problems = []
+    first = manifests[0][1]
+    count = first["shard"][1]
+    shards = set()
+    owners = {}
+
+    for name, manifest in manifests:
+        index, shard_count = manifest["shard"]
+        if shard_count != count:
+            problems.append("%s belongs to a run with %i shards, not %i" % (name, shard_count, count))
+            continue
+
+        if manifest["settings"] != first["settings"] or manifest["files"] != first["files"]:
+            problems.append("%s was created with other settings or files" % name)
+
+        shards.add(index)
+
+        for source, entry in sorted(manifest["sources"].items()):
+            if source in owners:
+                problems.append("%s is in shard %i and %i" % (source, owners[source], index))
+            owners[source] = index
+
+            if entry["status"] == "failed":
+                problems.append("%s failed in shard %i" % (source, index))
+            elif entry["output"] and not os.path.isfile(os.path.join(directory, entry["output"])):
+                problems.append("output of %s is missing: %s" % (source, entry["output"]))
+
+    for index in sorted(set(range(1, count + 1)) - shards):
+        problems.append("the manifest of shard %i is missing" % index)
+
+    if len(owners) != first["files"]:
+        problems.append("the manifests contain %i of %i files" % (len(owners), first["files"]))
+
+    return problems, len(owners)
+#@(check_manifests)
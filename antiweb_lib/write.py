@@ -6,10 +6,14 @@ __maintainer__ = "antiweb team"
 __email__ = "antiweb@freelists.org"
 
 import os
+import re
+import time
 import logging
 import sys
 
-from antiweb_lib.document import Document, WebError
+from antiweb_lib.document import Document, WebError, ExpansionBudget
+from antiweb_lib.cache import BuildCache
+from antiweb_lib.profiling import Profile, profiled, phase
 
 from antiweb_lib.readers.config import get_reader_for_file
 
@@ -29,7 +33,12 @@ This module is the mediator for all writing-related classes and modules
 #@include(_create_out_file_name doc)
 #@include(_create_doc_directory doc)
 #@include(_process_file doc)
+#@include(_write_output doc)
+#@include(log_errors doc)
+#@include(report_result doc)
+#@include(WriteResult doc)
 #@include(create_write_string doc)
+#@include(has_main_block doc)
 
 #@cstart(_create_out_file_name)
 
@@ -89,18 +98,49 @@ def generate(fname, tokens, show_warnings=False):
                                    via the logging module.
         :return: The generated documentation content as a string - None if an error occurred
     """
-    try:
-        with open(fname, "r") as f:
-            text = f.read()
-    except IOError as e:
-        logger.error("I/O error : " + e.strerror)
+    text = _read_source(fname)
+    if text is None:
         return None
 
     reader = get_reader_for_file(fname)
     document = Document(text, reader, fname, tokens)
     return document.process(show_warnings, fname)
+
+def _read_source(fname):
+    try:
+        with phase("read"), open(fname, "r") as f:
+            return f.read()
+    except IOError as e:
+        logger.error("I/O error : " + e.strerror)
+        return None
 #@(generate)
 
+#@cstart(has_main_block)
+_re_main_start = re.compile(br"@[rc]?start\(\)")
+
+def has_main_block(fname):
+#@start(has_main_block doc)
+    """
+.. py:method:: has_main_block(fname)
+
+   A fast check, if a file can create documentation. Without a main text block (a ``@start``,
+   ``@rstart`` or ``@cstart`` directive without a name) the file would only create an error.
+   The check searches the bytes of the file and does not lex it, so it may also accept a file
+   whose main text block is not in a comment.
+
+   :param string fname: The path of the source file.
+   :return: ``False`` if the file has no main text block. ``True`` otherwise or if the file cannot be read.
+    """
+#@include(has_main_block)
+#@(has_main_block doc)
+    try:
+        with open(fname, "rb") as f:
+            return _re_main_start.search(f.read()) is not None
+    except IOError:
+        #the error is reported when the file is processed
+        return True
+#@(has_main_block)
+
 #@cstart(_create_doc_directory)
 
 def _create_doc_directory(out_file):
@@ -125,39 +165,236 @@ def _create_doc_directory(out_file):
 #@(_create_doc_directory)
 
 #@cstart(_process_file)
-def _process_file(in_file, out_file, token, warnings):
+def _process_file(result, out_file, options):
 #@start(_process_file doc)
     """
-.. py:method:: _process_file(in_file, out_file, token, warnings)
+.. py:method:: _process_file(result, out_file, options)
 
-    If no output name was declared, the input name will be given.
+    Generates the documentation of the input file and writes it to the output file.
+    If a build cache is used (``--cache-dir`` option) and the input file and its included files
+    did not change, the cached output is written without processing the file
+    (see :ref:`Build Cache <label-build-cache>`). An output file with the same content
+    is not written again (see :py:meth:`_write_output`).
 
-    :param in_file: The path to the input file.
+    :param result: The :py:class:`WriteResult` of the input file. It is updated with the outcome.
     :param out_file: The path to the output file.
-    :param token: Passes on the tokens which the user set.
+    :param options: Commandline options.
     :return: The boolean could_write indicates if the file could be written.
     """
 #@include(_process_file)
 #@(_process_file doc)
 
 #The output text will be written in the output file. If there is an output text, the function returns could_write as True.
+#The errors are not logged here, the caller decides when to report them (see :py:meth:`log_errors`).
+
+    in_file = result.input_file
+    cache = BuildCache(options.cache_dir) if options.cache_dir else None
 
     could_write = False
     try:
-        text_output = generate(in_file, token, warnings)
+        text = _read_source(in_file)
+        text_output = None
+
+        if text is not None:
+            result.input_lines = len(text.splitlines())
+
+        if cache and text is not None:
+            entry = cache.lookup(in_file, text, options.token, options.engine)
+            if entry and options.warnings and entry.get("warnings") is None:
+                #the entry was stored without checking the warnings
+                entry = None
+
+            if entry:
+                result.cache_hit = True
+                result.dependencies = set(entry["dependencies"])
+                text_output = entry["output"]
+
+                if options.warnings:
+                    #write the warnings of the cached generation again
+                    result.warnings = list(entry["warnings"])
+                    for warning in result.warnings:
+                        logger.warning(warning)
+
+        if text is not None and not result.cache_hit:
+            reader = get_reader_for_file(in_file)
+            budget = ExpansionBudget(options.max_include_depth, options.max_lines)
+            document = Document(text, reader, in_file, options.token, budget=budget)
+            try:
+                text_output = document.process(options.warnings, in_file)
+            finally:
+                result.dependencies = document.get_dependencies()
+                result.warnings = document.warnings
+
+            if cache and text_output:
+                cache.store(in_file, text, options.token, result.dependencies, text_output, options.engine,
+                            result.warnings if options.warnings else None)
+
         if text_output:
-            with open(out_file, "w") as f:
-                f.write(text_output)
+            result.output_lines = len(text_output.splitlines())
+            with phase("write"):
+                result.unchanged = not _write_output(out_file, text_output)
             could_write = True
     except WebError as e:
-        logger.error("\nErrors:")
-        for l, d in e.error_list:
-            logger.error("  in line %i(%s): %s", l.index+1, l.fname, d)
-            logger.error("      %s", l.text)
+        result.error_list = e.error_list
 
     return could_write
 #@(_process_file)
 
+#@cstart(_write_output)
+def _write_output(out_file, text):
+#@start(_write_output doc)
+    """
+.. py:method:: _write_output(out_file, text)
+
+    Writes the text to the output file, if the file does not already contain the text.
+    An unchanged file keeps its modification time, so tools like Sphinx do not read
+    and render it again.
+
+    :param out_file: The path to the output file.
+    :param text: The generated documentation.
+    :return: ``False`` if the file was unchanged and not written, ``True`` otherwise.
+    """
+#@include(_write_output)
+#@(_write_output doc)
+    try:
+        #each character is written as at least one byte: a smaller file cannot contain the text
+        if os.path.getsize(out_file) >= len(text):
+            with open(out_file, "r") as f:
+                if f.read() == text:
+                    return False
+    except (IOError, UnicodeDecodeError):
+        #the file does not exist or cannot be read: it is written
+        pass
+
+    with open(out_file, "w") as f:
+        f.write(text)
+
+    return True
+#@(_write_output)
+
+#@cstart(log_errors)
+def log_errors(error_list):
+#@start(log_errors doc)
+    """
+.. py:method:: log_errors(error_list)
+
+    Writes the errors of a failed generation via the logging module.
+
+    :param error_list: A list of ``(line, text)`` tuples as found in :py:attr:`WebError.error_list`.
+    """
+#@include(log_errors)
+#@(log_errors doc)
+    if not error_list:
+        return
+
+    logger.error("\nErrors:")
+    for l, d in error_list:
+        logger.error("  in line %i(%s): %s", l.index+1, l.fname, d)
+        logger.error("      %s", l.text)
+#@(log_errors)
+
+#@cstart(report_result)
+def report_result(result, print_message=True):
+#@start(report_result doc)
+    """
+.. py:method:: report_result(result, print_message=True)
+
+    Reports the outcome of a processed file: the captured log messages, the errors
+    and the message created by :py:meth:`create_write_string`.
+
+    :param result: A :py:class:`WriteResult`.
+    :param print_message: Indicates whether a log message should be printed for the processed input file.
+    """
+#@include(report_result)
+#@(report_result doc)
+    for level, message in result.log_records:
+        logger.log(level, message)
+
+    log_errors(result.error_list)
+
+    if print_message:
+        log_message = create_write_string(result.input_file, result.out_file, result.unchanged)
+        print("\n"+log_message)
+#@(report_result)
+
+#@cstart(WriteResult)
+class WriteResult(object):
+    #@start(WriteResult doc)
+    """
+.. py:class:: WriteResult(input_file)
+
+   The outcome of processing a single input file. It is returned by :py:meth:`write_result`
+   and is small enough to be sent back from a worker process.
+
+   .. py:attribute:: input_file
+
+      The absolute path of the processed file.
+
+   .. py:attribute:: out_file
+
+      The absolute path of the generated documentation file or None if an error occurred.
+
+   .. py:attribute:: error_list
+
+      The ``(line, text)`` errors of a failed generation.
+
+   .. py:attribute:: warnings
+
+      The warning texts of the generation (see :py:attr:`Document.warnings`).
+
+   .. py:attribute:: dependencies
+
+      The absolute paths of the files read by ``@include`` directives.
+
+   .. py:attribute:: cache_hit
+
+      True if the output was taken from the build cache.
+
+   .. py:attribute:: unchanged
+
+      True if the output file already contained the generated documentation and was not written.
+
+   .. py:attribute:: duration
+
+      The time in seconds needed to process the file.
+
+   .. py:attribute:: input_lines
+
+      The number of lines of the input file.
+
+   .. py:attribute:: output_lines
+
+      The number of lines of the generated documentation.
+
+   .. py:attribute:: profile
+
+      The :py:class:`Profile` of the file if the ``--profile`` option is given, otherwise None
+      (see :ref:`Profiling <label-profiling>`).
+
+   .. py:attribute:: log_records
+
+      ``(level, message)`` tuples of log messages that were captured instead of being
+      written directly (used by worker processes, see :ref:`Parallel Processing <label-parallel>`).
+    """
+    #@include(WriteResult)
+    #@(WriteResult doc)
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.out_file = None
+        self.error_list = []
+        self.warnings = []
+        self.dependencies = set()
+        self.cache_hit = False
+        self.unchanged = False
+        self.duration = 0.0
+        self.input_lines = 0
+        self.output_lines = 0
+        self.profile = None
+        self.log_records = []
+
+#@(WriteResult)
+
 #@start(write_documentation)
 
 #Writing the documentation files
@@ -167,10 +404,11 @@ def _process_file(in_file, out_file, token, warnings):
 #The following function is called for the creation of the documentation files.
 
 #@include(write doc)
+#@include(write_result doc)
 #@include(write_body)
 #@(write_documentation)
 
-#@start(write)
+#@cstart(write)
 def write(working_dir, input_file, options, print_message=True):
 #@start(write doc)
     """
@@ -184,12 +422,87 @@ def write(working_dir, input_file, options, print_message=True):
    :param print_message: Indicates whether a log message should be printed for the processed input file.
    :return: the absolute path of the generated output file or None if an error occurred
     """
+#@include(write)
 #@(write doc)
+    result = write_result(working_dir, input_file, options)
+    report_result(result, print_message)
+    return result.out_file
+#@(write)
+
+#@start(write_result)
+def write_result(working_dir, input_file, options):
+#@start(write_result doc)
+    """
+.. py:method:: write_result(working_dir, input_file, options)
+
+   Does the work of :py:meth:`write` without reporting anything:
+   errors are not logged and no message is printed.
+
+   :param working_dir: Current working directory.
+   :param input_file: Contains the absolute path of the currently processed file.
+   :param options: Commandline options.
+   :return: A :py:class:`WriteResult`.
+    """
+#@(write_result doc)
 
 #@start(write_body)
 
 #Before the input file is processed the name of the output file has to be computed.
 #How the output file name is created depends on the different commandline options.
+
+#@code
+#@include(write_result)
+    out_file = get_out_file(working_dir, input_file, options)
+
+    #Create the documentation directory. If it can't be created the program exits.
+    _create_doc_directory(out_file)
+#@edoc
+
+#Now the input file is processed and the corresponding documentation file is created.
+#If processing is successful, ''could_write'' is set to ''True''.
+
+#@code
+    result = WriteResult(input_file)
+    if getattr(options, "profile", False):
+        result.profile = Profile()
+
+    start = time.perf_counter()
+    with profiled(result.profile):
+        could_write = _process_file(result, out_file, options)
+    result.duration = time.perf_counter() - start
+
+    if could_write:
+        #processing was successful
+        result.out_file = out_file
+
+    return result
+
+#@edoc
+
+#@include(get_out_file doc)
+#@include(get_out_file_body)
+
+#@(write_body)
+
+#@start(get_out_file)
+def get_out_file(working_dir, input_file, options):
+#@start(get_out_file doc)
+    """
+.. py:method:: get_out_file(working_dir, input_file, options)
+
+   Computes the absolute path of the documentation file for the input file.
+   The function does not touch the file system, so it can be used to predict
+   the output of a file before it is processed.
+
+   :param working_dir: Current working directory.
+   :param input_file: Contains the absolute path of the currently processed file.
+   :param options: Commandline options.
+   :return: The absolute path of the output file.
+    """
+#@(get_out_file doc)
+
+#@start(get_out_file_body)
+
 #When there is no output option given the output file name is created in the following way:
 
 #.. csv-table::
@@ -199,7 +512,7 @@ def write(working_dir, input_file, options, print_message=True):
 #   ``C:\antiweb\testing.rst``, *C:\\antiweb\\testing_docs.rst*
 
 #@code
-#@include(write)
+#@include(get_out_file)
 
     #options.output is either an absolute path or None
     output = options.output
@@ -207,7 +520,6 @@ def write(working_dir, input_file, options, print_message=True):
 
     if not output:
         out_file = _create_out_file_name(working_dir, input_file)
-
 #@edoc
 
 #If there is an output given, we have to distinguish between the recursive and non-recursive option.
@@ -259,48 +571,30 @@ def write(working_dir, input_file, options, print_message=True):
                 directory = output
                 out_file = _create_out_file_name(directory, input_file)
 
-    #Create the documentation directory. If it can't be created the program exits.
-    _create_doc_directory(out_file)
-#@edoc
-
-#Now the input file is processed and the corresponding documentation file is created.
-#If processing is successful, ''could_write'' is set to ''True''.
-
-#@code
-    could_write = _process_file(input_file, out_file, options.token, options.warnings)
-
-    generated_file = None
-
-    if could_write:
-        #processing was successful
-        generated_file = out_file
-
-    if print_message:
-        log_message = create_write_string(input_file, generated_file)
-        print("\n"+log_message)
-
-    return generated_file
-
+    return out_file
 #@edoc
 
-#@(write_body)
+#@(get_out_file_body)
 
 #@cstart(create_write_string)
-def create_write_string(input_file, created_file):
+def create_write_string(input_file, created_file, unchanged=False):
 #@start(create_write_string doc)
     """
-.. py:method:: create_write_string(could_write, input_file, created_file)
+.. py:method:: create_write_string(input_file, created_file[, unchanged])
 
     Creates a string message based on the value of the created_file.
 
     :param input_file: Contains the absolute path of the currently processed file.
     :param created_file: Contains the absolute path of the created documentation file.
+    :param unchanged: True if the documentation file was not written, because its content did not change.
     :return: A created string based on the value of created_file.
     """
 #@include(create_write_string)
 #@(create_write_string doc)
 
-    if created_file:
+    if created_file and unchanged:
+        out_string = "Unchanged " + created_file + " from: " + input_file
+    elif created_file:
         out_string = "Generated " + created_file + " from: " + input_file
     else:
         out_string = "Could not generate documentation file for: " + input_file
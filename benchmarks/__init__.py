@@ -0,0 +1,9 @@
+"""
+The benchmarks of antiweb. Each module can be run as a script, see its usage.
+
+  * ``bench_suite.py``: times ``generate()``, ``-r`` and the daemon on a synthetic corpus
+    (``corpus.py``) and compares the results with a baseline.
+  * ``bench_engines.py``: the pygments and the native comment engine.
+  * ``bench_memory.py``: the peak memory of a large file.
+  * ``bench_startup.py``: the cold start time.
+"""
@@ -0,0 +1,72 @@
+"""
+Compares the time of the two engines finding the comments (``--engine`` option).
+
+Each file is read by its reader once with the pygments lexer and once with the
+native scanner of its language. Without arguments the five largest python modules
+of antiweb are measured.
+
+usage: python benchmarks/bench_engines.py [-n RUNS] [FILE ...]
+"""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from antiweb_lib.readers import config
+
+
+def largest_modules(count):
+    modules = []
+    for directory, dirs, files in os.walk(root):
+        modules.extend(os.path.join(directory, f) for f in files if f.endswith(".py"))
+
+    modules.sort(key=os.path.getsize, reverse=True)
+    return modules[:count]
+
+
+def measure(fname, text, engine, runs):
+    config.set_engines([engine])
+    durations = []
+    for i in range(runs):
+        reader = config.get_reader_for_file(fname)
+        start = time.perf_counter()
+        reader.process(fname, text)
+        durations.append(time.perf_counter() - start)
+
+    return min(durations)
+
+
+def main():
+    parser = OptionParser("usage: %prog [options] [FILE ...]")
+    parser.add_option("-n", "--runs", dest="runs", default=5, type="int",
+                      help="number of runs for each file and engine (default: 5)")
+    options, args = parser.parse_args()
+
+    total = dict.fromkeys(config.engines, 0.0)
+    for fname in args or largest_modules(5):
+        language = config.get_language_for_file(fname)
+        if language is None or language.scanner is None:
+            print("%s: the native engine is not supported" % fname)
+            continue
+
+        with open(fname) as f:
+            text = f.read()
+
+        times = [ measure(fname, text, engine, options.runs) for engine in config.engines ]
+        print("%-40s %7i lines  pygments %.3f s  native %.3f s  (%.1fx)"
+              % (os.path.relpath(fname, root), text.count("\n"), times[0], times[1], times[0] / times[1]))
+
+        for engine, duration in zip(config.engines, times):
+            total[engine] += duration
+
+    if total["native"]:
+        print("total: pygments %.3f s, native %.3f s (%.1fx)"
+              % (total["pygments"], total["native"], total["pygments"] / total["native"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures the peak memory and the time antiweb needs to process a large generated source file.
+
+usage: python benchmarks/bench_memory.py [-b BLOCKS] [-l LINES]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antiweb_lib.document import Document
+from antiweb_lib.readers.config import get_reader_for_file
+
+
+def generate_source(blocks, lines):
+    text = ["//@start()"]
+    text.extend("//@include(block%i)" % i for i in range(blocks))
+
+    for i in range(blocks):
+        text.append("//@cstart(block%i)" % i)
+        text.append("int block%i(int value)" % i)
+        text.append("{")
+        text.extend("    value = value * %i + %i; //a comment" % (j, i) for j in range(lines))
+        text.append("    return value;")
+        text.append("}")
+        text.append("//@(block%i)" % i)
+
+    return "\n".join(text) + "\n"
+
+
+def run(text):
+    fname = "bench_memory.c"
+    document = Document(text, get_reader_for_file(fname), fname, [])
+    return document.process(False, fname)
+
+
+def main():
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("-b", "--blocks", dest="blocks", default=500, type="int",
+                      help="number of generated text blocks (default: 500)")
+    parser.add_option("-l", "--lines", dest="lines", default=40, type="int",
+                      help="number of code lines per block (default: 40)")
+    options, args = parser.parse_args()
+
+    text = generate_source(options.blocks, options.lines)
+    line_count = text.count("\n")
+
+    #measure the time without tracemalloc, it slows down allocations
+    start = time.perf_counter()
+    run(text)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    run(text)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("source lines: %i" % line_count)
+    print("time:         %.3f s" % duration)
+    print("peak memory:  %.1f MiB" % (peak / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures the cold start time of antiweb.
+
+Two commands are run in a new python process each time:
+
+  * ``python antiweb.py --version``: the import time of antiweb.
+  * ``python antiweb.py -o OUT tests/data/test/block1.c``: a single small C file.
+
+The median of several runs is compared with the budget. Watchdog, BeautifulSoup,
+multiprocessing and the pygments lexers of other languages must not be imported
+by these commands, otherwise the budget is exceeded on a typical machine
+(reference: --version 0.08 s, single file 0.15 s).
+
+usage: python benchmarks/bench_startup.py [-n RUNS] [--no-budget]
+
+The exit code is 1 if a budget is exceeded.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#the budget in seconds: (name, arguments, budget)
+budgets = [
+    ("--version", ["--version"], 0.15),
+    ("single file", ["-o", os.path.join(tempfile.gettempdir(), "bench_startup.rst"),
+                     os.path.join(root, "tests", "data", "test", "block1.c")], 0.30),
+]
+
+
+def measure(args, runs):
+    durations = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, os.path.join(root, "antiweb.py")] + args,
+                              stdout=subprocess.DEVNULL, cwd=root)
+        durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    return durations[len(durations) // 2]
+
+
+def main():
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("-n", "--runs", dest="runs", default=7, type="int",
+                      help="number of runs of each command (default: 7)")
+    parser.add_option("--no-budget", dest="budget", default=True, action="store_false",
+                      help="only print the times")
+    options, args = parser.parse_args()
+
+    exceeded = False
+    for name, args, budget in budgets:
+        duration = measure(args, options.runs)
+        over = duration > budget
+        exceeded = exceeded or over
+        print("%-12s %.3f s (budget %.2f s)%s" % (name, duration, budget, " EXCEEDED" if over else ""))
+
+    if exceeded and options.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
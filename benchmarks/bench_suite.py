@@ -0,0 +1,243 @@
+"""
+Measures antiweb on a synthetic corpus (see ``corpus.py``) and compares the results with a baseline.
+
+The measurements are:
+
+  * ``generate/LANGUAGE``: ``generate()`` of all files of a language in this process.
+  * ``recursive``: ``python antiweb.py -r`` over the whole corpus in a new process
+    (with ``--jobs`` given to antiweb).
+  * ``daemon latency``: the time from changing a source file until the daemon
+    has written the new documentation (including the ``--debounce-ms`` window).
+
+Each value is the median of several runs in seconds. With ``-o`` the results are written
+as a json file, which can be the ``--baseline`` of a later run. A measurement that is
+slower than the baseline by more than ``--threshold`` percent is a regression.
+
+usage: python benchmarks/bench_suite.py [options]
+
+The exit code is 1 if a regression was found.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import contextlib
+from optparse import OptionParser
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from benchmarks.corpus import languages, write_corpus, add_corpus_options, corpus_parameters
+from antiweb_lib.write import generate, get_out_file
+from antiweb_lib.document import subdoc_cache
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def antiweb_options(args):
+    #the options of the daemon are parsed like the commandline of antiweb
+    from antiweb import parsing
+
+    argv = sys.argv
+    sys.argv = ["antiweb.py"] + args
+    try:
+        options, args, parser = parsing()
+    finally:
+        sys.argv = argv
+
+    options.warnings = True
+    return options
+
+
+def measure_generate(paths, runs):
+    durations = []
+    for i in range(runs):
+        #each run reads the included files again, like a new process
+        subdoc_cache.clear()
+        start = time.perf_counter()
+        for path in paths:
+            generate(path, [])
+        durations.append(time.perf_counter() - start)
+
+    return median(durations)
+
+
+def measure_recursive(directory, output, runs, jobs):
+    durations = []
+    for i in range(runs):
+        #all files are written in each run
+        shutil.rmtree(output, ignore_errors=True)
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, os.path.join(root, "antiweb.py"), "-r", "-o", output,
+                               "-j", str(jobs), directory], stdout=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+
+    return median(durations)
+
+
+def measure_daemon(directory, output, source, runs, debounce_ms, timeout=10.0):
+    #watchdog is only needed for this measurement
+    from watchdog.observers import Observer
+    from antiweb_lib.filechangehandler import FileChangeHandler
+
+    options = antiweb_options(["-r", "-o", output, "--debounce-ms", str(debounce_ms), directory])
+    out_file = get_out_file(directory, source, options)
+    with open(source) as f:
+        text = f.read()
+
+    handler = FileChangeHandler(directory, options, set())
+    observer = Observer()
+    observer.schedule(handler, path=directory, recursive=True)
+    observer.start()
+
+    durations = []
+    try:
+        #the daemon prints a message for each file
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(runs):
+                marker = "Changed %i" % i
+                start = time.perf_counter()
+                with open(source, "w") as f:
+                    f.write(text.replace("Source", marker, 1))
+
+                while not _contains(out_file, marker):
+                    if time.perf_counter() - start > timeout:
+                        raise RuntimeError("the daemon did not write %s" % out_file)
+                    time.sleep(0.002)
+
+                durations.append(time.perf_counter() - start)
+    finally:
+        observer.stop()
+        observer.join()
+        handler.stop()
+        with open(source, "w") as f:
+            f.write(text)
+
+    return median(durations)
+
+
+def _contains(fname, marker):
+    try:
+        with open(fname) as f:
+            return marker in f.read()
+    except IOError:
+        return False
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the results with the results of a baseline.
+
+    :return: A list of ``(name, baseline, result, change)`` tuples for the measurements
+             in both results and a list of the names of the regressions. The change
+             is the relative change (0.1 means 10% slower).
+    """
+    rows = []
+    regressions = []
+    for name in sorted(results):
+        if not baseline.get(name):
+            continue
+
+        change = results[name] / baseline[name] - 1.0
+        rows.append((name, baseline[name], results[name], change))
+        if change > threshold:
+            regressions.append(name)
+
+    return rows, regressions
+
+
+def main():
+    parser = OptionParser("usage: %prog [options]")
+    add_corpus_options(parser)
+    parser.add_option("--runs", dest="runs", default=5, type="int",
+                      help="number of runs of each measurement (default: 5)")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1, type="int",
+                      help="the --jobs option of the recursive run (default: 1)")
+    parser.add_option("--debounce-ms", dest="debounce_ms", default=200, type="int",
+                      help="the --debounce-ms option of the daemon (default: 200)")
+    parser.add_option("--no-daemon", dest="daemon", default=True, action="store_false",
+                      help="do not measure the daemon latency")
+    parser.add_option("-o", "--output", dest="output", default="",
+                      help="writes the results to a json file")
+    parser.add_option("--baseline", dest="baseline", default="",
+                      help="a json file of a previous run to compare with")
+    parser.add_option("--threshold", dest="threshold", default=20.0, type="float",
+                      help="a measurement slower than the baseline by more percent is a regression (default: 20)")
+    options, args = parser.parse_args()
+
+    selected = options.languages or languages
+    unknown = set(selected) - set(languages)
+    if unknown:
+        parser.error("unknown languages: %s (supported: %s)" % (", ".join(sorted(unknown)), ", ".join(languages)))
+
+    parameters = corpus_parameters(options)
+    temp_dir = tempfile.mkdtemp(prefix="antiweb_bench_")
+    directory = os.path.join(temp_dir, "corpus")
+    output = os.path.join(temp_dir, "docs")
+
+    results = {}
+    try:
+        corpus = { language : write_corpus(directory, language, options.files, **parameters)
+                   for language in selected }
+
+        #files changed within the last seconds are not kept by the subdoc cache
+        past = time.time() - 60
+        for paths in corpus.values():
+            for path in paths:
+                os.utime(path, (past, past))
+
+        for language in selected:
+            results["generate/" + language] = measure_generate(corpus[language], options.runs)
+
+        results["recursive"] = measure_recursive(directory, output, options.runs, options.jobs)
+
+        if options.daemon:
+            source = corpus[selected[0]][0]
+            results["daemon latency"] = measure_daemon(directory, output, source, options.runs,
+                                                       options.debounce_ms)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    data = { "corpus" : dict(parameters, files=options.files, languages=selected),
+             "jobs" : options.jobs,
+             "debounce_ms" : options.debounce_ms,
+             "python" : platform.python_version(),
+             "platform" : platform.platform(),
+             "results" : results }
+
+    for name in sorted(results):
+        print("%-28s %8.4f s" % (name, results[name]))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline.get("corpus") != data["corpus"]:
+            print("\nwarning: the baseline was measured with another corpus")
+
+        rows, regressions = compare(results, baseline.get("results", {}), options.threshold / 100.0)
+
+        print("\ncompared with %s:" % options.baseline)
+        for name, before, after, change in rows:
+            print("%-28s %8.4f s -> %8.4f s %+7.1f%%%s"
+                  % (name, before, after, change * 100.0, " REGRESSION" if name in regressions else ""))
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Generates a synthetic corpus of source files for the benchmarks.
+
+Each file contains a main text block including ``--blocks`` text blocks. A text block
+documents a function with ``--lines`` code lines, the functions are nested ``--depth`` levels
+deep and each level includes the next one. With ``--fanout`` the main block also includes the
+first block of the next files, with ``--macros`` the blocks use inline macros.
+
+usage: python benchmarks/corpus.py [options] DIRECTORY
+"""
+
+import os
+from optparse import OptionParser
+
+#language name -> (extension, comment, function header, code line, function footer)
+#comment is None for a language without single line comments: its comments are blocks (<!-- -->)
+syntaxes = {
+    "C" : ("c", "//%s", ["int %s(int value) {"], "    value = value * %i + %i;", ["    return value;", "}"]),
+    "C++" : ("cpp", "//%s", ["int %s(int value) {"], "    value = value * %i + %i; // a comment", ["    return value;", "}"]),
+    "C#" : ("cs", "//%s", ["static int %s(int value) {"], "    value = value * %i + %i;", ["    return value;", "}"]),
+    "Python" : ("py", "#%s", ["def %s(value):"], "    value = value * %i + %i", ["    return value"]),
+    "Clojure" : ("clj", ";%s", ["(defn %s [value]"], "  (* value %i %i)", ["  value)"]),
+    "reStructuredText" : ("rst", ".. %s", ["%s", ""], "   value * %i + %i", [""]),
+    "XML" : ("xml", None, ["<function name=\"%s\">"], "  <step factor=\"%i\" offset=\"%i\"/>", ["</function>"]),
+}
+
+languages = sorted(syntaxes)
+
+
+def source_name(language, index):
+    extension = syntaxes[language][0]
+    return "%s_source%i.%s" % (extension, index, extension)
+
+
+def generate_source(language, index=0, files=1, lines=20, blocks=10, depth=1, fanout=0, macros=0):
+    """
+    Returns the text of the source file ``index`` of a corpus with ``files`` files.
+    """
+    extension, comment, header, code_line, footer = syntaxes[language]
+    text = []
+
+    def doc(indent, doc_lines):
+        if comment is None:
+            #the comment markers must not be part of the code
+            doc_lines = ["<!--"] + doc_lines + ["-->"]
+            if doc_lines[-2] == "@code":
+                doc_lines[-2:] = ["@code -->"]
+            if doc_lines[1] == "@edoc":
+                doc_lines[:2] = ["<!-- @edoc"]
+            text.extend(indent + l for l in doc_lines)
+        else:
+            text.extend(indent + comment % l for l in doc_lines)
+
+    def block(i, level, indent):
+        name = "block%i" % i if not level else "block%i_%i" % (i, level)
+        nested = level + 1 < depth
+        description = "Function %s" % name
+        if macros:
+            description += " uses @subst(macro%i)" % ((i + level) % macros)
+
+        doc_lines = ["@start(%s)" % name, description]
+        if nested:
+            doc_lines.append("@include(block%i_%i)" % (i, level + 1))
+
+        doc(indent, doc_lines + ["@code"])
+        text.extend(indent + l.replace("%s", name) for l in header)
+        text.extend(indent + code_line % (j, i) for j in range(lines))
+
+        #the nested function is defined in the code, if the code can contain comments
+        if nested and comment is not None:
+            block(i, level + 1, indent + "    ")
+
+        text.extend(indent + l for l in footer)
+        doc(indent, ["@edoc"])
+
+        if nested and comment is None:
+            block(i, level + 1, indent + "    ")
+
+        doc(indent, ["@(%s)" % name])
+
+    if macros:
+        doc("", ["@start(__macros__)"]
+                + [ "@define(macro%i, value %i)" % (m, m) for m in range(macros) ]
+                + ["@(__macros__)"])
+
+    title = "Source %i" % index
+    main_block = ["@start()", title, "=" * len(title)]
+    main_block.extend("@include(block%i)" % i for i in range(blocks))
+
+    others = [ (index + j) % files for j in range(1, fanout + 1) ]
+    main_block.extend("@include(block0, %s)" % source_name(language, o)
+                      for o in sorted(set(others)) if o != index)
+
+    doc("", main_block + ["@()"])
+
+    for i in range(blocks):
+        block(i, 0, "")
+
+    return "\n".join(text) + "\n"
+
+
+def write_corpus(directory, language, files=10, **parameters):
+    """
+    Writes ``files`` source files of the language into the directory.
+    The further parameters are passed to :py:func:`generate_source`.
+
+    :return: The paths of the written files.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, source_name(language, index))
+        with open(path, "w") as f:
+            f.write(generate_source(language, index, files, **parameters))
+        paths.append(path)
+
+    return paths
+
+
+def add_corpus_options(parser):
+    parser.add_option("-f", "--files", dest="files", default=10, type="int",
+                      help="number of files of each language (default: 10)")
+    parser.add_option("-n", "--lines", dest="lines", default=20, type="int",
+                      help="number of code lines of each function (default: 20)")
+    parser.add_option("-b", "--blocks", dest="blocks", default=10, type="int",
+                      help="number of text blocks included by the main block (default: 10)")
+    parser.add_option("-d", "--depth", dest="depth", default=2, type="int",
+                      help="nesting depth of the text blocks (default: 2)")
+    parser.add_option("--fanout", dest="fanout", default=2, type="int",
+                      help="number of other files included by each file (default: 2)")
+    parser.add_option("--macros", dest="macros", default=2, type="int",
+                      help="number of macros substituted in the text blocks (default: 2)")
+    parser.add_option("-l", "--language", dest="languages", action="append", default=[],
+                      help="a language of the corpus, can be given several times (default: all)")
+
+
+def corpus_parameters(options):
+    return { "lines" : options.lines, "blocks" : options.blocks, "depth" : options.depth,
+             "fanout" : options.fanout, "macros" : options.macros }
+
+
+def main():
+    parser = OptionParser("usage: %prog [options] DIRECTORY")
+    add_corpus_options(parser)
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error("a directory is needed")
+
+    unknown = set(options.languages) - set(languages)
+    if unknown:
+        parser.error("unknown languages: %s (supported: %s)" % (", ".join(sorted(unknown)), ", ".join(languages)))
+
+    for language in options.languages or languages:
+        paths = write_corpus(args[0], language, options.files, **corpus_parameters(options))
+        print("%-18s %i files" % (language, len(paths)))
+
+
+if __name__ == "__main__":
+    main()
@@ -42,5 +42,5 @@ setup(
     platforms='any',
     scripts=['antiweb.py'],
     py_modules=['antisphinx'],
-    packages=find_packages(exclude=['tests']), 
+    packages=find_packages(exclude=['tests', 'benchmarks', 'benchmarks.*']), 
 )
@@ -5,12 +5,32 @@ import unittest
 from unittest.mock import patch
 from antiweb import main
 from antiweb_lib.readers.GenericReader import GenericReader
+from antiweb_lib.document import Document, DirectiveSchedule, SubdocCache, subdoc_cache, ExpansionBudget, WebError
+from antiweb_lib.readers.Line import Line
+from antiweb_lib.directives import directives, scanner, Start
+from antiweb_lib.readers.config import get_reader_for_file, is_file_supported
+from antiweb_lib.readers import Language
+from antiweb_lib.readers import config
+from pygments.token import Token
+from fnmatch import fnmatch
+from antiweb_lib.filechangehandler import FileChangeHandler
+from antiweb_lib.write import WriteResult, generate, write_result, create_write_string, get_out_file
+from antiweb_lib.profiling import Profile, profiled, phase, phases
+from antiweb_lib.sharding import parse_shard, check_manifests, manifest_name
+from antiweb_lib.cache import BuildCache
+from benchmarks import corpus, bench_suite
+from watchdog.events import FileModifiedEvent, FileCreatedEvent, FileDeletedEvent
+from optparse import Values
 import sys
 import os
 import shutil
 from tests.testutil import TempDir
 from tests.testutil import DataDir
 import time
+import threading
+import subprocess
+import io
+import json
 from multiprocessing import Process
 
 sys.path.append("..")
@@ -177,6 +197,13 @@ class Test_Antiweb(unittest.TestCase):
         with patch.object(sys, 'argv', self.test_args):
             self.functional("", "small_testfile.rst", compare_path_small_testfile, main())
 
+    def test_antiweb_r_jobs(self):
+        compare_path_small_testfile = self.data_dir.get_path("small_testfile.rst")
+        self.test_args = ['antiweb.py', "-r", "-j", "2", self.temp_dir.get_path()]
+
+        with patch.object(sys, 'argv', self.test_args):
+            self.functional("", "small_testfile.rst", compare_path_small_testfile, main())
+
     def test_antiweb_r_o_no_argument(self):
         previ_dir = os.getcwd()
         os.chdir(self.temp_dir.get_relative_path())
@@ -363,6 +390,17 @@ class Test_Antiweb_rst(unittest.TestCase):
         with patch.object(sys, 'argv', self.test_args):
             self.functional(self.doc_dir, "ein_rst_docs.rst", compare_path_small_testfile, main())
 
+    def test_antiweb_rst_r_jobs(self):
+        #the created ein_rst_docs.rst must not be processed again
+        shutil.copyfile(self.data_dir.get_path("ein_rst_docs.rst"), self.temp_dir.get_path("ein_rst_docs.rst"))
+        compare_path_small_testfile = self.data_dir.get_path("ein_rst_docs.rst")
+        self.test_args = ['antiweb.py', "-r", "-j", "2", self.temp_dir.get_path()]
+
+        with patch.object(sys, 'argv', self.test_args):
+            self.functional("", "ein_rst_docs.rst", compare_path_small_testfile, main())
+
+        self.file_not_exist(self.temp_dir.get_path("ein_rst_docs_docs.rst"))
+
     def test_antiweb_rst_r(self):
         compare_path_small_testfile = self.data_dir.get_path("ein_rst_docs.rst")
         self.test_args = ['antiweb.py', "-r", self.temp_dir.get_path()]
@@ -482,6 +520,920 @@ class Test_Antiweb_Clojure(unittest.TestCase):
         with patch.object(sys, 'argv', self.test_args):
             self.functional("", "test_clojure.rst", compare_path, main())
 
+class Test_BuildCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = TempDir()
+        self.data_dir = DataDir("test")
+        self.cache_dir = self.temp_dir.get_path("cache")
+
+        #other_file.c includes a block of block1.c
+        for fname in ("other_file.c", "block1.c"):
+            self.temp_dir.copy_file(self.data_dir.get_path(fname), self.temp_dir.get_path("src", fname))
+
+        self.test_args = ['antiweb.py', "-c", self.cache_dir, "-o", self.temp_dir.get_path("docs"),
+                          "-r", self.temp_dir.get_path("src")]
+
+    def read_output(self):
+        with open(self.temp_dir.get_path("docs", "other_file.rst")) as output:
+            return output.read()
+
+    def test_cache_hit(self):
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+            first_output = self.read_output()
+
+            with patch.object(Document, "process") as process:
+                self.assertTrue(main())
+                self.assertFalse(process.called)
+
+        self.assertEqual(self.read_output(), first_output)
+
+    def test_changed_include(self):
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+
+            include_file = self.temp_dir.get_path("src", "block1.c")
+            with open(include_file) as f:
+                text = f.read()
+
+            with open(include_file, "w") as f:
+                f.write(text.replace("Include subtext1 block", "Changed subtext1 block"))
+
+            self.assertTrue(main())
+
+        self.assertIn("Changed subtext1 block", self.read_output())
+
+    def test_failed_store(self):
+        cache = BuildCache(self.cache_dir)
+
+        with patch("antiweb_lib.fileutil.os.replace", side_effect=OSError("replace failed")), \
+             self.assertLogs("antiweb", "WARNING"):
+            cache.store(self.temp_dir.get_path("src", "block1.c"), "text", [], [], "output")
+
+        #the temporary file is removed
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_cached_warnings(self):
+        with open(self.temp_dir.get_path("src", "unused.py"), "w") as f:
+            f.write("#@start()\ntext\n#@()\n#@start(unused)\nunused text\n#@(unused)\n")
+
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+
+            #the warnings of a cached file are written again
+            with patch.object(Document, "process") as process, \
+                 self.assertLogs("antiweb", "WARNING") as logs:
+                self.assertTrue(main())
+                self.assertFalse(process.called)
+
+        self.assertIn("block not included: unused(line 4)", "\n".join(logs.output))
+
+    def test_changed_engine(self):
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+
+        #an entry of another engine is not used
+        with patch.object(sys, 'argv', self.test_args + ["--engine", "native"]):
+            with patch.object(Document, "process", autospec=True, side_effect=Document.process) as process:
+                self.assertTrue(main())
+                self.assertTrue(process.called)
+
+    def tearDown(self):
+        config.set_engine("pygments")
+        self.temp_dir.remove_tempdir()
+
+class Test_Incremental(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = TempDir()
+        self.data_dir = DataDir("test")
+
+        #other_file.c includes a block of block1.c
+        for fname in ("other_file.c", "block1.c", "block2.c"):
+            self.temp_dir.copy_file(self.data_dir.get_path(fname), self.temp_dir.get_path("src", fname))
+
+        self.test_args = ['antiweb.py', "-i", "-o", self.temp_dir.get_path("docs"),
+                          "-r", self.temp_dir.get_path("src")]
+
+    def processed_files(self):
+        with patch.object(Document, "process", autospec=True, side_effect=Document.process) as process:
+            self.assertTrue(main())
+        return set(os.path.basename(call[0][0].fname) for call in process.call_args_list)
+
+    def test_unchanged(self):
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+            self.assertTrue(os.path.isfile(self.temp_dir.get_path("docs", ".antiweb_deps.json")))
+            self.assertEqual(self.processed_files(), set())
+
+    def test_changed_include(self):
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+
+            include_file = self.temp_dir.get_path("src", "block1.c")
+            with open(include_file, "a") as f:
+                f.write("\n")
+
+            self.assertEqual(self.processed_files(), set(["block1.c", "other_file.c"]))
+
+    def test_missing_include(self):
+        source = self.temp_dir.get_path("src", "missing.c")
+        document = Document("/*\n@start()\n@include(block, later.c)\n@*/\n", get_reader_for_file(source), source, [])
+        self.assertRaises(WebError, document.process, False, source)
+
+        #creating the missing file regenerates the documentation
+        self.assertIn(self.temp_dir.get_path("src", "later.c"), document.get_dependencies())
+
+    def test_deleted_output(self):
+        with patch.object(sys, 'argv', self.test_args):
+            self.assertTrue(main())
+            os.remove(self.temp_dir.get_path("docs", "block2.rst"))
+            self.assertEqual(self.processed_files(), set(["block2.c"]))
+
+    def tearDown(self):
+        self.temp_dir.remove_tempdir()
+
+class Test_UnchangedOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = TempDir()
+        self.source = self.temp_dir.get_path("src", "small_testfile.py")
+        self.temp_dir.copy_file(DataDir("unittest").get_path("small_testfile.py"), self.source)
+        self.out_file = self.temp_dir.get_path("docs", "small_testfile.rst")
+        self.options = Values({ "output" : self.temp_dir.get_path("docs"), "recursive" : False,
+                                "cache_dir" : None, "token" : [], "warnings" : False,
+                                "max_include_depth" : None, "max_lines" : None })
+
+    def write(self):
+        result = write_result(self.temp_dir.get_path(), self.source, self.options)
+        self.assertEqual(result.out_file, self.out_file)
+        return result
+
+    def test_unchanged(self):
+        self.assertFalse(self.write().unchanged)
+
+        #an old modification time is kept, if the output does not change
+        os.utime(self.out_file, (0, 0))
+        result = self.write()
+        self.assertTrue(result.unchanged)
+        self.assertEqual(os.path.getmtime(self.out_file), 0)
+        self.assertTrue(create_write_string(self.source, result.out_file, result.unchanged).startswith("Unchanged"))
+
+        with open(self.source) as f:
+            text = f.read()
+        with open(self.source, "w") as f:
+            f.write(text.replace("text", "changed text"))
+
+        self.assertFalse(self.write().unchanged)
+        self.assertNotEqual(os.path.getmtime(self.out_file), 0)
+
+    def tearDown(self):
+        self.temp_dir.remove_tempdir()
+
+class Test_Profile(unittest.TestCase):
+
+    def test_nested_phases(self):
+        profile = Profile()
+        with profiled(profile):
+            with phase("compile"):
+                time.sleep(0.02)
+                with phase("read"):
+                    time.sleep(0.02)
+
+        self.assertGreaterEqual(profile.times["read"], 0.02)
+        #the nested phase is not counted twice
+        self.assertAlmostEqual(profile.total, sum(profile.times.values()), delta=0.01)
+
+        #outside of profiled nothing is measured
+        with phase("compile"):
+            pass
+        self.assertEqual(profile.times["lex"], 0.0)
+
+    def test_profile_option(self):
+        temp_dir = TempDir()
+        try:
+            source = temp_dir.get_path("small_testfile.py")
+            temp_dir.copy_file(DataDir("unittest").get_path("small_testfile.py"), source)
+            json_file = temp_dir.get_path("profile.json")
+
+            with patch.object(sys, 'argv', ['antiweb.py', "--profile-json", json_file, source]):
+                self.assertTrue(main())
+
+            with open(json_file) as f:
+                data = json.load(f)
+
+            times = data["files"][source]["times"]
+            self.assertEqual(sorted(times), sorted(phases))
+            self.assertGreater(times["lex"], 0)
+            self.assertLessEqual(sum(times.values()), data["files"][source]["total"])
+        finally:
+            temp_dir.remove_tempdir()
+
+class Test_Report(unittest.TestCase):
+
+    def test_report_option(self):
+        temp_dir = TempDir()
+        try:
+            source = temp_dir.get_path("small_testfile.py")
+            temp_dir.copy_file(DataDir("unittest").get_path("small_testfile.py"), source)
+            broken = temp_dir.get_path("broken.py")
+            with open(broken, "w") as f:
+                f.write("#@start()\n#@include(missing)\n#@()\n")
+            report_file = temp_dir.get_path("report.json")
+
+            output = io.StringIO()
+            with patch.object(sys, 'argv', ['antiweb.py', "-r", "-q", "--report", report_file, temp_dir.get_path()]):
+                with patch.object(sys, 'stdout', output):
+                    self.assertTrue(main())
+
+            #-q suppresses the message of each file
+            self.assertNotIn("Generated", output.getvalue())
+            self.assertNotIn(source, output.getvalue())
+
+            with open(report_file) as f:
+                report = json.load(f)
+
+            files = { entry["input"] : entry for entry in report["files"] }
+            self.assertEqual(files[source]["status"], "generated")
+            self.assertEqual(files[source]["output"], temp_dir.get_path("small_testfile.rst"))
+            self.assertGreater(files[source]["output_lines"], 0)
+            self.assertFalse(files[source]["cache_hit"])
+
+            self.assertEqual(files[broken]["status"], "failed")
+            self.assertIsNone(files[broken]["output"])
+            self.assertEqual(files[broken]["errors"][0]["line"], 2)
+
+            summary = report["summary"]
+            self.assertEqual((summary["files"], summary["generated"], summary["failed"]), (2, 1, 1))
+            self.assertEqual(summary["input_lines"], files[source]["input_lines"] + 3)
+        finally:
+            temp_dir.remove_tempdir()
+
+class Test_Sharding(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for text in ("0/4", "5/4", "2", "a/b"):
+            self.assertRaises(ValueError, parse_shard, text)
+
+    def test_shards(self):
+        temp_dir = TempDir()
+        try:
+            source_dir = temp_dir.get_path("source")
+            merged_dir = temp_dir.get_path("merged")
+            os.mkdir(source_dir)
+            os.mkdir(merged_dir)
+
+            names = ["file%i.py" % i for i in range(8)]
+            for name in names:
+                temp_dir.copy_file(DataDir("unittest").get_path("small_testfile.py"), os.path.join(source_dir, name))
+
+            #the documentation of file0.py: it must be in the same shard
+            with open(os.path.join(source_dir, "file0.rst"), "w") as f:
+                f.write(".. @start()\n\nshadowed\n\n.. @(\n")
+
+            #each shard runs on its own copy, like on different machines
+            sources = {}
+            for index in (1, 2, 3):
+                shard_dir = temp_dir.get_path("shard%i" % index)
+                shutil.copytree(source_dir, shard_dir)
+
+                with patch.object(sys, 'argv', ['antiweb.py', "-r", "-q", "--shard", "%i/3" % index, shard_dir]):
+                    self.assertTrue(main())
+
+                with open(os.path.join(shard_dir, manifest_name(index, 3))) as f:
+                    manifest = json.load(f)
+
+                self.assertEqual(manifest["files"], 9)
+                for source, entry in manifest["sources"].items():
+                    self.assertNotIn(source, sources)
+                    sources[source] = entry
+
+                #the outputs and the manifest are merged
+                shutil.copy(os.path.join(shard_dir, manifest_name(index, 3)), merged_dir)
+                for source, entry in manifest["sources"].items():
+                    if entry["output"]:
+                        shutil.copy(os.path.join(shard_dir, entry["output"]), merged_dir)
+
+            self.assertEqual(sorted(sources), sorted(names + ["file0.rst"]))
+            self.assertEqual(sources["file0.rst"]["status"], "created")
+            self.assertEqual(sources["file3.py"], { "status" : "generated", "output" : "file3.rst" })
+
+            self.assertEqual(check_manifests(merged_dir), ([], 9))
+
+            os.remove(os.path.join(merged_dir, "file3.rst"))
+            problems, files = check_manifests(merged_dir)
+            self.assertEqual(problems, ["output of file3.py is missing: file3.rst"])
+
+            os.remove(os.path.join(merged_dir, manifest_name(2, 3)))
+            with patch.object(sys, 'argv', ['antiweb.py', "--check-shards", merged_dir]):
+                self.assertRaises(SystemExit, main)
+        finally:
+            temp_dir.remove_tempdir()
+
+class Test_ModuleDocs(unittest.TestCase):
+
+    def test_module_docs(self):
+        #the modules document themselves: a literal directive in a docstring breaks their documentation
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for name in ("cache", "dependencies", "directives", "filechangehandler", "fileutil", "parallel",
+                     "profiling", "report", "sharding", "write"):
+            path = os.path.join(root, "antiweb_lib", name + ".py")
+            with open(path) as f:
+                text = f.read()
+
+            document = Document(text, get_reader_for_file(path), path, [])
+            self.assertIsNotNone(document.process(True, path), path)
+            self.assertEqual([ w for w in document.warnings if not w.startswith("block not included: generate") ],
+                             [], path)
+
+class Test_BenchmarkCorpus(unittest.TestCase):
+
+    def test_languages(self):
+        temp_dir = TempDir()
+        try:
+            for language in corpus.languages:
+                paths = corpus.write_corpus(temp_dir.get_path(), language, 3, lines=2, blocks=2,
+                                            depth=3, fanout=2, macros=2)
+                for path in paths:
+                    self.assertTrue(is_file_supported(path), path)
+                    output = generate(path, [])
+
+                    #two own blocks and the first block of the two other files, each with 3 levels
+                    self.assertEqual(output.count("Function block"), 12, path)
+                    self.assertEqual(output.count("Function block0_2 uses value 0"), 3, path)
+                    self.assertNotIn("@", output, path)
+        finally:
+            temp_dir.remove_tempdir()
+
+    def test_compare(self):
+        rows, regressions = bench_suite.compare({ "a" : 1.5, "b" : 1.0, "c" : 2.0 },
+                                                { "a" : 1.0, "b" : 1.0 }, 0.2)
+        self.assertEqual([ r[0] for r in rows ], ["a", "b"])
+        self.assertEqual(regressions, ["a"])
+
+class Test_SubdocCache(unittest.TestCase):
+
+    common = "/*\n@start(shared)\nWho: @subst(who)\n@(shared)\n*/\n"
+
+    def setUp(self):
+        self.temp_dir = TempDir()
+        subdoc_cache.clear()
+
+        macros = "@start(__macros__)\n@define(who, A)\n@(__macros__)\n"
+        for fname, text in (("a.c", macros), ("b.c", "")):
+            self.write(fname, "/*\n%s@start()\n%s\n@include(shared, common.c)\n@*/\n" % (text, fname))
+
+        self.write("common.c", self.common)
+
+    def write(self, fname, text):
+        path = self.temp_dir.get_path(fname)
+        with open(path, "w") as f:
+            f.write(text)
+
+        #files modified within the last seconds are not cached
+        os.utime(path, (time.time() - 60, time.time() - 60 + len(text)))
+
+    def generate(self, fname):
+        return generate(self.temp_dir.get_path(fname), [])
+
+    def test_shared(self):
+        reader_class = type(get_reader_for_file("common.c"))
+        with patch.object(reader_class, "process", autospec=True, side_effect=reader_class.process) as process:
+            outputs = [ self.generate(f) for f in ("a.c", "b.c", "a.c") ]
+
+        #common.c was lexed once
+        self.assertEqual([ c[0][1] for c in process.call_args_list ].count("common.c"), 1)
+        self.assertEqual(process.call_count, 4)
+        self.assertEqual(len(subdoc_cache), 1)
+
+        #the macros of a.c are not visible for b.c
+        self.assertIn("Who: A", outputs[0])
+        self.assertIn("Who: @subst(who)", outputs[1])
+        self.assertEqual(outputs[2], outputs[0])
+
+    def test_changed_file(self):
+        self.assertIn("Who: A", self.generate("a.c"))
+        self.write("common.c", self.common.replace("Who", "Changed"))
+        self.assertIn("Changed: A", self.generate("a.c"))
+
+    def test_lru(self):
+        cache = SubdocCache(max_lines=10)
+        reader = get_reader_for_file("common.c")
+        stat = (0, 1)
+
+        with patch("antiweb_lib.document.stat_file", return_value=stat):
+            for fname in ("x.c", "y.c", "z.c"):
+                cache.store(fname, reader, stat, [ Line(fname, i, "line") for i in range(4) ])
+
+            self.assertIsNone(cache.lookup("x.c", reader, "x.c"))
+            self.assertEqual(len(cache.lookup("y.c", reader, "y.c")), 4)
+            self.assertEqual(cache.line_count, 8)
+
+    def tearDown(self):
+        subdoc_cache.clear()
+        self.temp_dir.remove_tempdir()
+
+class Test_ExpansionBudget(unittest.TestCase):
+
+    def create_text(self, levels):
+        #each block includes the next block twice: the output grows exponentially
+        text = ["/*", "@start()", "@include(b0)", "@*/"]
+        for i in range(levels):
+            text += ["/*", "@start(b%i)" % i, "@include(b%i)" % (i+1), "@include(b%i)" % (i+1), "@(b%i)" % i, "*/"]
+
+        return "\n".join(text + ["/*", "@start(b%i)" % levels, "leaf", "@(b%i)" % levels, "*/"])
+
+    def process(self, text, budget=None):
+        document = Document(text, get_reader_for_file("test.c"), "test.c", [], budget=budget)
+        return document.process(False, "test.c")
+
+    def assertWebError(self, text, message, budget=None):
+        with self.assertRaises(WebError) as cm:
+            self.process(text, budget)
+
+        self.assertIn(message, cm.exception.error_list[-1][1])
+
+    def test_within_budget(self):
+        self.assertEqual(self.process(self.create_text(4)).split(), ["leaf"] * 16)
+
+    def test_limits(self):
+        self.assertWebError(self.create_text(30), "Maximum number of included lines")
+        self.assertWebError(self.create_text(4), "Maximum number of included lines", ExpansionBudget(max_lines=8))
+        self.assertWebError(self.create_text(4), "Maximum include depth (3)", ExpansionBudget(max_depth=3))
+
+    def test_cycle(self):
+        text = "/*\n@start()\n@include(a)\n@*/\n/*\n@start(a)\n@include(b)\n@(a)\n@start(b)\n@include(a)\n@(b)\n*/\n"
+        self.assertWebError(text, "Include cycle: a(test.c) -> b(test.c) -> a(test.c)")
+
+class Test_Prefilter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = TempDir()
+        self.temp_dir.copy_file(DataDir("test").get_path("block1.c"), self.temp_dir.get_path("src", "block1.c"))
+
+        with open(self.temp_dir.get_path("src", "plain.c"), "w") as f:
+            f.write("int main(void) { return 0; } //no antiweb start\n")
+
+    def test_skip_files_without_start(self):
+        test_args = ['antiweb.py', "-o", self.temp_dir.get_path("docs"), "-r", self.temp_dir.get_path("src")]
+
+        with patch.object(sys, 'argv', test_args), \
+             patch.object(Document, "process", autospec=True, side_effect=Document.process) as process, \
+             self.assertLogs("antiweb", "INFO") as logs:
+            self.assertTrue(main())
+
+        self.assertEqual([os.path.basename(call[0][0].fname) for call in process.call_args_list], ["block1.c"])
+        self.assertIn("Skipped 1 files without a @start() directive", "\n".join(logs.output))
+        self.assertFalse(os.path.exists(self.temp_dir.get_path("docs", "plain.rst")))
+
+    def tearDown(self):
+        self.temp_dir.remove_tempdir()
+
+class Test_FileChangeHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.options = Values({"debounce_ms" : 50, "output" : None, "recursive" : True})
+        self.processed = []
+
+    def write_result(self, directory, input_file, options):
+        self.processed.append(input_file)
+        result = WriteResult(input_file)
+        result.out_file = get_out_file(directory, input_file, options)
+        return result
+
+    def test_debounce(self):
+        handler = FileChangeHandler("/src", self.options, set())
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=self.write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"):
+            for i in range(5):
+                handler.process_event(FileModifiedEvent("/src/a.py"))
+                handler.process_event(FileModifiedEvent("/src/b.c"))
+
+            handler.process_event(FileDeletedEvent("/src/b.c"))
+            self.assertEqual(self.processed, [])
+
+            time.sleep(0.5)
+            handler.join()
+            handler.stop()
+
+        self.assertEqual(self.processed, ["/src/a.py"])
+
+    def test_max_wait(self):
+        handler = FileChangeHandler("/src", self.options, set())
+        threads = threading.active_count()
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=self.write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"):
+            #a steady stream of events must not postpone the batch forever
+            for i in range(50):
+                handler.process_event(FileModifiedEvent("/src/a.py"))
+                time.sleep(0.02)
+
+            processed = list(self.processed)
+            #no thread is started for the events
+            self.assertLessEqual(threading.active_count(), threads)
+            handler.stop()
+
+        self.assertIn("/src/a.py", processed)
+
+    def test_stop(self):
+        handler = FileChangeHandler("/src", self.options, set())
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=self.write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"):
+            handler.process_event(FileModifiedEvent("/src/a.py"))
+            handler.stop()
+            time.sleep(0.2)
+
+        self.assertEqual(self.processed, [])
+
+    def test_queued_once(self):
+        self.options.debounce_ms = 0
+        handler = FileChangeHandler("/src", self.options, set())
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def blocking_write_result(directory, input_file, options):
+            started.set()
+            proceed.wait(5)
+            return self.write_result(directory, input_file, options)
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=blocking_write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"):
+            handler.process_event(FileModifiedEvent("/src/a.py"))
+            self.assertTrue(started.wait(5))
+
+            #a.py is processed: it is processed again afterwards, b.py is queued only once
+            for i in range(3):
+                handler.process_event(FileModifiedEvent("/src/b.c"))
+                handler.process_event(FileModifiedEvent("/src/a.py"))
+
+            proceed.set()
+            handler.join()
+            handler.stop()
+
+        self.assertEqual(self.processed, ["/src/a.py", "/src/a.py", "/src/b.c"])
+
+    def test_failing_file(self):
+        self.options.debounce_ms = 0
+        handler = FileChangeHandler("/src", self.options, set())
+
+        def failing_write_result(directory, input_file, options):
+            if not self.processed:
+                self.processed.append(None)
+                raise SystemExit(1)
+            return self.write_result(directory, input_file, options)
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=failing_write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"):
+            handler.process_event(FileModifiedEvent("/src/a.py"))
+            handler.join()
+
+            #the worker is still running and the file can be processed again
+            handler.process_event(FileModifiedEvent("/src/a.py"))
+            handler.join()
+            handler.stop()
+
+        self.assertEqual(self.processed, [None, "/src/a.py"])
+
+    def test_output_in_watched_directory(self):
+        self.options.debounce_ms = 0
+        self.options.output = "/src/docs"
+        handler = FileChangeHandler("/src", self.options, set())
+
+        def writing_write_result(directory, input_file, options):
+            result = self.write_result(directory, input_file, options)
+            if input_file == "/src/a.py":
+                #the observer reports the output file before write_result returns
+                handler.process_event(FileCreatedEvent(result.out_file))
+                handler.process_event(FileModifiedEvent(result.out_file))
+            return result
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=writing_write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"):
+            handler.process_event(FileModifiedEvent("/src/a.py"))
+            handler.join()
+            handler.stop()
+
+        self.assertEqual(self.processed, ["/src/a.py"])
+
+    def test_profile(self):
+        self.options.debounce_ms = 0
+
+        def profiled_write_result(directory, input_file, options):
+            result = self.write_result(directory, input_file, options)
+            result.profile = Profile()
+            return result
+
+        output = io.StringIO()
+        handler = FileChangeHandler("/src", self.options, set())
+
+        with patch("antiweb_lib.filechangehandler.write_result", side_effect=profiled_write_result), \
+             patch("antiweb_lib.filechangehandler.report_result"), patch.object(sys, 'stdout', output):
+            handler.process_event(FileModifiedEvent("/src/a.py"))
+            handler.join()
+            handler.stop()
+
+        #the timings are printed and kept for the table of the whole run
+        self.assertIn("total (1 files)", output.getvalue())
+        self.assertEqual([ r.input_file for r in handler.results ], ["/src/a.py"])
+
+class Test_DirectiveScanner(unittest.TestCase):
+
+    def finditer(self, text):
+        return [ (d, mo) for d in directives.values() for mo in d.expression.finditer(text) ]
+
+    def assertSameDirectives(self, text):
+        expected = [ (d, mo.span(), mo.groups()) for d, mo in self.finditer(text) ]
+        found = [ (d, mo.span(), mo.groups()) for d, mo in scanner.scan(text) ]
+        self.assertEqual(found, expected)
+
+    def test_texts(self):
+        for text in ["", "no directive", "@", "@@", "mail@example.com @", "@(name)  \n@code @edoc",
+                     "@start(a) @start(b)\n@include(a) @include(b)", "@indent -4 @indent+2",
+                     "@subst(a) @subst(b)", "@if(x)\n@fi(x)\n@\n", "@rstart(a)@cstart(b)@"]:
+            self.assertSameDirectives(text)
+
+    def test_data_files(self):
+        for data_dir in ("test", "unittest", "unittest_rst", "unittest_csharp"):
+            directory = DataDir(data_dir).get_path()
+            for fname in sorted(os.listdir(directory)):
+                path = os.path.join(directory, fname)
+                if os.path.isfile(path):
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        self.assertSameDirectives(f.read())
+
+class Test_DirectiveSchedule(unittest.TestCase):
+
+    def make_line(self, index, *priorities):
+        line_directives = []
+        for priority in priorities:
+            directive_class = type("Priority%i" % priority, (directives["ignore"],), { "priority" : priority })
+            line_directives.append(directive_class(index))
+
+        return Line("test", index, "line %i" % index, line_directives)
+
+    def find_next_directive(self, block):
+        #the search of the former compile_block
+        min_line = [ (l.directives[0].priority, i) for i, l in enumerate(block) if l.directives ]
+        return min(min_line)[1] if min_line else None
+
+    def test_changes(self):
+        block = [ self.make_line(i, *p) for i, p in enumerate([(10,), (), (2, 10), (4,), (), (10,), (2,)]) ]
+        schedule = DirectiveSchedule(block)
+
+        changes = [ lambda b, i: b.__setitem__(slice(i, i+1), [self.make_line(20, 2), self.make_line(21, 10)]),
+                    lambda b, i: b.__delitem__(slice(i, i+2)),
+                    lambda b, i: b.insert(0, self.make_line(22, 4)),
+                    lambda b, i: b.append(self.make_line(23, 2)),
+                    lambda b, i: b.__setitem__(-1, self.make_line(24, 10)),
+                    lambda b, i: b.pop(),
+                    lambda b, i: b.__delitem__(i) ]
+
+        count = 0
+        while True:
+            expected = self.find_next_directive(schedule)
+            directive_index = schedule.next_directive()
+            if not directive_index:
+                self.assertIsNone(expected)
+                break
+
+            self.assertEqual(directive_index[1], expected)
+            changes[count % len(changes)](schedule, directive_index[1])
+            count += 1
+
+        self.assertGreater(count, len(changes))
+
+    def test_shared_line(self):
+        shared = self.make_line(0, 2, 10)
+        schedule = DirectiveSchedule([self.make_line(1, 4), shared])
+
+        #another block sharing the line processed its first directive
+        shared.directives.pop(0)
+
+        self.assertEqual(schedule.next_directive()[1], 0)
+        self.assertEqual(schedule.next_directive()[1], 1)
+        self.assertIsNone(schedule.next_directive())
+
+class Test_BlockEnds(unittest.TestCase):
+
+    text = """
+//@start()
+//@include(a)
+    //@start(a)
+    a
+        //@start(b)
+        b
+    //@(a)
+//@start(c)
+c
+    //@start(d)
+    d
+    //@
+    //@start(e)
+    e
+  //@start(f)
+  f
+//@(unknown)
+//@start(g)
+g
+    //@start(g)
+    //@(g)
+//@(g)
+"""
+
+    def test_find_block_ends(self):
+        reader = get_reader_for_file("test.c")
+        lines = reader.process("test.c", self.text)
+
+        starts = 0
+        for i, l in enumerate(lines):
+            for d in l.directives:
+                if isinstance(d, Start):
+                    starts += 1
+                    self.assertEqual(d.end_line - i, d._find_matching_end(lines, i), str(d))
+
+        self.assertEqual(starts, 9)
+
+class Test_Line(unittest.TestCase):
+
+    def assertCached(self, line):
+        self.assertEqual(line.indent, len(line.text) - len(line.text.lstrip()))
+        self.assertEqual(len(line), len(line.text.strip()))
+        self.assertEqual(line.sindent, " " * line.indent)
+
+    def test_cached_values(self):
+        line = Line("test", 0, "    text  ")
+        self.assertCached(line)
+
+        for delta in (2, -1, -10, 3):
+            line.change_indent(delta)
+            self.assertCached(line)
+
+        line.text = "  new text"
+        self.assertCached(line)
+        self.assertEqual(line.like("like").indent, 2)
+
+        empty = Line("test", 0, "   ").change_indent(-1)
+        self.assertCached(empty)
+        self.assertFalse(empty)
+
+    def test_modified(self):
+        line = Line("test", 3, "text", type='c')
+        self.assertIs(line.modified(), line)
+        self.assertIs(line.modified(-4, index=3, type='c'), line)
+
+        changed = line.modified(2, type='d')
+        self.assertCached(changed)
+        self.assertEqual((changed.text, changed.index, changed.type), ("  text", 3, 'd'))
+        self.assertEqual((line.text, line.type), ("text", 'c'))
+
+    def test_shared_lines(self):
+        #a.c is included twice without a change of the indentation: its lines are shared
+        text = "/*\n@start()\n@include(a)\n@include(a)\n@code\n  code\n@*/\n/*\n@start(a)\n//a line\n@(a)\n*/\n"
+        document = Document(text, get_reader_for_file("test.c"), "test.c", [])
+        lines = [ (l.text, list(l.directives)) for l in document.lines ]
+
+        self.assertEqual(document.process(False, "test.c").split("\n"),
+                         ["a line", "a line", "", "::", "", "      code", ""])
+
+        #the lines of the document are not changed
+        self.assertEqual([ (l.text, list(l.directives)) for l in document.lines ], lines)
+        self.assertIs(document.blocks["a"][0], document.lines[9])
+
+class Test_Language(unittest.TestCase):
+
+    def test_lazy_import(self):
+        #the supported files are known without importing a lexer or a reader module
+        code = ("import sys; import antiweb_lib.readers.config as config; "
+                "config.is_file_supported('test.cs'); "
+                "print(' '.join(m for m in ('bs4', 'pygments.lexers.dotnet', 'antiweb_lib.readers.CSharpReader') "
+                "if m in sys.modules))")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=root, universal_newlines=True)
+        self.assertEqual(output.strip(), "")
+
+    def test_startup_imports(self):
+        #the optional dependencies are imported when they are needed
+        code = ("import sys; import antiweb; "
+                "print(' '.join(m for m in ('watchdog', 'bs4', 'multiprocessing', 'pygments.lexers') "
+                "if m in sys.modules))")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=root, universal_newlines=True)
+        self.assertEqual(output.strip(), "")
+
+    def test_file_index(self):
+        files = ["a.c", "/dir/a.h", "a.cpp", "b.C", "x.c++", "x.xbm", "x.xpm", "x.xcm", "dir.c/file.py",
+                 "SConstruct", "/dir/SConstruct", "a.tar.rst", ".rst", "a.py.bak", "noext", "a.xml", "a.CS"]
+
+        for fname in files:
+            expected = None
+            for language in config.supported_languages:
+                if any(fnmatch(fname, pattern) for pattern in language.supported_files):
+                    expected = language
+                    break
+
+            self.assertIs(config.get_language_for_file(fname), expected, fname)
+            self.assertEqual(config.is_file_supported(fname), expected is not None, fname)
+
+    def test_supported_files(self):
+        patterns = sum([ language.supported_files for language in config.supported_languages ], [])
+        self.assertEqual(list(config.supported_files), patterns)
+        self.assertIn("*.cs", config.supported_files)
+
+        #the public metadata of pygments gives the same patterns
+        with patch.dict(sys.modules, { "pygments.lexers._mapping" : None }):
+            self.assertEqual(Language._lexer_filenames("C#"), ["*.cs"])
+
+    def test_reader(self):
+        reader = get_reader_for_file("test.cs")
+        self.assertEqual(reader.__class__.__name__, "CSharpReader")
+        self.assertEqual(reader.lexer.name, "C#")
+
+    def test_reused_reader(self):
+        reader = get_reader_for_file("a.py")
+        self.assertIs(get_reader_for_file("b.py"), reader)
+
+        #a thread gets its own reader
+        readers = []
+        thread = threading.Thread(target=lambda: readers.append(get_reader_for_file("a.py")))
+        thread.start()
+        thread.join()
+        self.assertIsNot(readers[0], reader)
+
+        #the state of a previous file is cleared
+        path = DataDir("unittest").get_path("small_testfile.py")
+        with open(path) as f:
+            text = f.read()
+
+        first = [ (l.text, repr(l.directives)) for l in reader.process(path, text) ]
+        second = [ (l.text, repr(l.directives)) for l in reader.process(path, text) ]
+        self.assertEqual(first, second)
+        self.assertEqual(reader.doc_lines, [])
+
+class Test_CommentScanner(unittest.TestCase):
+
+    def tearDown(self):
+        config.set_engine("pygments")
+
+    def get_directives(self, fname, text, engine):
+        config.set_engine(engine)
+        lines = get_reader_for_file(fname).process(fname, text)
+        return [ (l.text, [ repr(d) for d in l.directives ]) for l in lines ]
+
+    def test_strings(self):
+        text = 'a = "// @start(x)"; // @start()\nb = \'"\'; /* @code\n */ c = "\\" //" \\\n"unterminated // @edoc\n'
+        tokens = config.get_language_for_file("test.c").scanner.get_tokens_unprocessed(text)
+        self.assertEqual([ v for i, t, v in tokens ], ["// @start()", "/* @code\n */"])
+
+    def test_conformance(self):
+        #both engines must find the same directives in all files supporting the native engine
+        count = 0
+        for data_dir in ("test", "unittest", "unittest_rst", "unittest_csharp", "unittest_clojure", "unittest_xml"):
+            directory = DataDir(data_dir).get_path()
+            for fname in sorted(os.listdir(directory)):
+                path = os.path.join(directory, fname)
+                language = config.get_language_for_file(path)
+                if not os.path.isfile(path) or language is None or language.scanner is None:
+                    continue
+
+                with open(path) as f:
+                    text = f.read()
+
+                self.assertEqual(self.get_directives(path, text, "native"),
+                                 self.get_directives(path, text, "pygments"), path)
+                count += 1
+
+        self.assertGreater(count, 20)
+
+    def test_fallback(self):
+        config.set_engine("native")
+        self.assertEqual(get_reader_for_file("test.rst").lexer.name, "reStructuredText")
+        self.assertIs(get_reader_for_file("test.c").lexer, config.get_language_for_file("test.c").scanner)
+
+    def test_python(self):
+        text = 'def f():\n    r"""doc"""\n    x = """no doc""" # comment\n    f"""no doc"""\n\n  """wrong indent"""\n'
+        language = config.get_language_for_file("test.py")
+
+        def comments(lexer, source):
+            return [ t for t in lexer.get_tokens_unprocessed(source)
+                     if t[1] in Token.Comment or t[1] in Token.Literal.String.Doc ]
+
+        #the wrong indentation and the unterminated string are lexed by pygments
+        for source in (text, text[:text.index("\n\n")], text + '"unterminated'):
+            self.assertEqual(comments(language.scanner, source), comments(language.lexer, source))
+
+    def test_set_engines(self):
+        config.set_engines(["native", "python=pygments"])
+        self.assertEqual([ l.engine for l in config.supported_languages if l.name in ("C", "Python") ],
+                         ["native", "pygments"])
+
+        self.assertRaises(ValueError, config.set_engines, ["fast"])
+        self.assertRaises(ValueError, config.set_engines, ["Cobol=native"])
+
 class Test_GenericReader(unittest.TestCase):
 
     def setUp(self):